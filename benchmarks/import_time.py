@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What importing eval.py used to cost: both provider SDKs and the message classes up front
+EAGER_IMPORTS = "import langchain_openai, langchain_anthropic, langchain_core.messages, dotenv, tools.tool_utils"
+
+CASES = {
+    "python": "pass",
+    "eval (lazy)": "import eval",
+    "tools.evaluator (lazy)": "import tools.evaluator",
+    "provider SDKs (eager)": EAGER_IMPORTS,
+}
+
+
+def time_import(statement: str, repeats: int = 5) -> list:
+    """
+    Wall time of a fresh interpreter running `statement` from the repo root, once per repeat
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=REPO_ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(repeats: int = 5) -> dict:
+    results = {}
+    for name, statement in CASES.items():
+        try:
+            timings = time_import(statement, repeats)
+        except subprocess.CalledProcessError:
+            print(f"error: Skipping {name}, the import failed")
+            continue
+        results[name] = {"median_s": round(statistics.median(timings), 4), "min_s": round(min(timings), 4)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold start of the evaluator against the eager provider imports")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.repeats)
+    for name, timing in results.items():
+        print(f"{name:<26} median {timing['median_s'] * 1000:8.1f} ms   min {timing['min_s'] * 1000:8.1f} ms")
+    if "eval (lazy)" in results and "provider SDKs (eager)" in results:
+        saved = results["provider SDKs (eager)"]["median_s"] - results["eval (lazy)"]["median_s"]
+        print(f"Startup reduction: {saved * 1000:.1f} ms")
+    print(json.dumps(results))
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.import_time import REPO_ROOT, time_import
+from tools.demonstration_index import DEMONSTRATIONS_PATH
+from tools.tracing import count_tokens
+from tools.evaluator import Evaluator
+from tools.offline_chat import OfflineChatModel
+from tools.request_dataset import DATASET_DIR, load_dataset
+from tools.tool_utils import _file_digest, clear_image_cache, prepare_image_message
+
+BASELINE_DIR = os.path.join("benchmarks", "baselines")
+PROMPT_MODULES = [
+    "prompts.strategist_prompt",
+    "prompts.background_designer_prompt",
+    "prompts.foreground_designer_prompt",
+    "prompts.foreground_designer_refinement_prompt",
+    "prompts.developer_prompt",
+    "prompts.design_reviewer_prompt",
+    "prompts.eval_prompt",
+]
+CONCURRENCY_LEVELS = [1, 8, 32, 128]
+# Metrics that differ by more than this share from the baseline, in the wrong direction, are regressions
+DEFAULT_THRESHOLD = 0.15
+# Absolute changes below these are timer or allocator noise, whatever their relative size
+NOISE_FLOOR = {"us": 1.0, "s": 0.01, "MB": 5.0}
+
+
+def _metric(value, unit: str, better: str) -> dict:
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def bench_image_encoding(repeats: int = 3) -> dict:
+    """
+    prepare_image_message over logos_png: cold base64 encoding, memoized hits, and downscaled webp re-encoding
+    """
+    logos = sorted(os.path.join(DATASET_DIR, "logos_png", name) for name in os.listdir(os.path.join(DATASET_DIR, "logos_png")) if name.endswith(".png"))
+    total_mb = sum(os.path.getsize(path) for path in logos) / 1e6
+    results = {}
+    for name, options in (("base64", {}), ("webp_512", {"max_edge": 512, "image_format": "webp", "disk_cache": False})):
+        cold, warm = [], []
+        for _ in range(repeats):
+            clear_image_cache()
+            _file_digest.cache_clear()
+            start = time.perf_counter()
+            for path in logos:
+                prepare_image_message(path, **options)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for path in logos:
+                prepare_image_message(path, **options)
+            warm.append(time.perf_counter() - start)
+        results[f"image_encoding.{name}.cold_images_per_s"] = _metric(len(logos) / min(cold), "images/s", "higher")
+        results[f"image_encoding.{name}.cold_mb_per_s"] = _metric(total_mb / min(cold), "MB/s", "higher")
+        results[f"image_encoding.{name}.cached_images_per_s"] = _metric(len(logos) / min(warm), "images/s", "higher")
+    clear_image_cache()
+    return results
+
+
+def _sample_fields(record) -> dict:
+    return {
+        "width": record.width, "height": record.height, "user_input": record.request, "purpose": record.purpose,
+        "audience": record.audience, "mood": "Friendly and energetic", "findings": "- [error] headline extends 12px past the right edge",
+    }
+
+
+def bench_prompts(repeats: int = 200) -> dict:
+    """
+    Build time, characters and tokens of every prompt, with template fields filled from a BannerRequest400 row
+    """
+    fields = _sample_fields(load_dataset("abstract_400")[0])
+    prompts = {}
+    for module_name in PROMPT_MODULES:
+        module = importlib.import_module(module_name)
+        for name, value in vars(module).items():
+            if name.startswith("_") or not isinstance(value, str) or len(value) < 200:
+                continue
+            names = {field for _, field, _, _ in string.Formatter().parse(value) if field} if "{" in value else set()
+            try:
+                value.format(**fields)
+                # Static prompts cost nothing to build, only their size is tracked
+                build = (lambda template=value: template.format(**fields)) if names else value
+            except (KeyError, ValueError, IndexError):
+                # Prompts with literal braces (JSON examples) are used as is
+                build = value
+            prompts[f"{module_name.split('.')[-1]}.{name}"] = build
+
+    from prompts.eval_prompt import SCORE_PRINCIPLES, build_multi_metric_prompt, build_system_prompt
+    for metric in SCORE_PRINCIPLES:
+        prompts[f"eval_prompt.build_system_prompt.{metric}"] = lambda metric=metric: build_system_prompt(metric)
+    prompts["eval_prompt.build_multi_metric_prompt.all"] = lambda: build_multi_metric_prompt(list(SCORE_PRINCIPLES))
+    if os.path.exists(DEMONSTRATIONS_PATH):
+        from prompts.foreground_designer_prompt import build_foreground_designer_system_prompt
+        prompts["foreground_designer_prompt.all_demonstrations"] = lambda: build_foreground_designer_system_prompt(k=None)
+        prompts["foreground_designer_prompt.top3_demonstrations"] = lambda: build_foreground_designer_system_prompt(fields["width"], fields["height"])
+
+    results = {}
+    for name, build in prompts.items():
+        text = build if isinstance(build, str) else build()
+        if not isinstance(build, str):
+            # Best of several rounds, microsecond timings are noisy
+            rounds = []
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    build()
+                rounds.append((time.perf_counter() - start) / repeats)
+            results[f"prompt.{name}.build_us"] = _metric(min(rounds) * 1e6, "us", "lower")
+        results[f"prompt.{name}.chars"] = _metric(len(text), "chars", "lower")
+        results[f"prompt.{name}.tokens"] = _metric(count_tokens(text), "tokens", "lower")
+    return results
+
+
+def _write_manifest(path: str, rows: int, metric: str):
+    """
+    Manifest over BannerRequest400 requests. There are no generated banners in the repo, so each logo also stands in for its banner.
+    """
+    dataset = load_dataset("abstract_400")
+    with open(path, "w") as f:
+        for i in range(rows):
+            record = dataset[i % len(dataset)]
+            f.write(json.dumps({"image_file": record.logo_png, "logo_file": record.logo_png,
+                                "banner_request": record.request, "metric": metric}) + "\n")
+
+
+def bench_eval(rows: int = 400, latency_ms: float = 50.0, concurrency_levels: list = CONCURRENCY_LEVELS, metric: str = "all") -> dict:
+    """
+    End-to-end Evaluator.run_batch throughput against the synthetic chat model, without the judgment cache
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest, output = os.path.join(tmp, "manifest.jsonl"), os.path.join(tmp, "results.jsonl")
+        _write_manifest(manifest, rows, metric)
+        for concurrency in concurrency_levels:
+            clear_image_cache()
+            chat_model = OfflineChatModel("synthetic", latency_ms=latency_ms)
+            evaluator = Evaluator("synthetic", chat_model=chat_model)
+            stats = asyncio.run(evaluator.run_batch(manifest, output, concurrency, multi_metric=True, default_metric=metric))
+            results[f"eval.c{concurrency}.rows_per_s"] = _metric(stats["throughput_rows_per_s"], "rows/s", "higher")
+            results[f"eval.c{concurrency}.llm_calls_per_s"] = _metric(chat_model.calls / stats["wall_time_s"], "calls/s", "higher")
+            results[f"eval.c{concurrency}.latency_p95_s"] = _metric(stats["latency_p95_s"], "s", "lower")
+    return results
+
+
+def bench_startup(repeats: int = 5) -> dict:
+    import_s = time_import("import eval", repeats)
+    help_s = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "eval.py", "--help"], cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+        help_s.append(time.perf_counter() - start)
+    return {
+        "startup.import_eval_s": _metric(statistics.median(import_s), "s", "lower"),
+        "startup.eval_help_s": _metric(statistics.median(help_s), "s", "lower"),
+    }
+
+
+BENCHMARKS = {
+    "images": bench_image_encoding,
+    "prompts": bench_prompts,
+    "eval": bench_eval,
+    "startup": bench_startup,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_group(name: str, eval_rows: int, latency_ms: float) -> dict:
+    metrics = bench_eval(eval_rows, latency_ms) if name == "eval" else BENCHMARKS[name]()
+    metrics[f"memory.peak_rss_{name}_mb"] = _metric(peak_rss_mb(), "MB", "lower")
+    return metrics
+
+
+def run(selected: list = None, eval_rows: int = 400, latency_ms: float = 50.0) -> dict:
+    """
+    Run the selected benchmarks (all by default) and return {"meta", "metrics"}. Each group runs in a fresh
+    process, so that its peak RSS is its own rather than the largest of the groups before it.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    metrics = {}
+    for name in selected or BENCHMARKS:
+        print(f"Running {name} benchmarks")
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            metrics.update(pool.submit(_run_group, name, eval_rows, latency_ms).result())
+    meta = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "eval_rows": eval_rows,
+        "latency_ms": latency_ms,
+    }
+    return {"meta": meta, "metrics": metrics}
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Relative change of every metric present in both runs, flagging changes worse than threshold
+    """
+    rows = []
+    for name, base in baseline["metrics"].items():
+        if name not in current["metrics"] or not base["value"]:
+            continue
+        value = current["metrics"][name]["value"]
+        change = (value - base["value"]) / abs(base["value"])
+        worse = -change if base["better"] == "higher" else change
+        noise = abs(value - base["value"]) < NOISE_FLOOR.get(base["unit"], 0.0)
+        rows.append({"metric": name, "baseline": base["value"], "current": value, "unit": base["unit"],
+                     "change": round(change, 4), "regression": worse > threshold and not noise})
+    return rows
+
+
+def format_comparison(rows: list) -> str:
+    width = max([len(row["metric"]) for row in rows] + [6])
+    lines = [f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['metric']:<{width}}  {row['baseline']:>12.4g}  {row['current']:>12.4g}  {row['change']:>+8.1%}{flag}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark image encoding, prompt building, eval throughput, memory and startup")
+    parser.add_argument("--only", type=str, nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--output", type=str, help="Where to save the results", default=os.path.join(BASELINE_DIR, "latest.json"))
+    parser.add_argument("--compare", type=str, help="Baseline JSON to compare against; exits with 1 on regressions")
+    parser.add_argument("--current", type=str, help="Compare this saved result instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative change counted as a regression")
+    parser.add_argument("--eval_rows", type=int, default=400)
+    parser.add_argument("--latency_ms", type=float, default=50.0, help="Median latency of the synthetic evaluator")
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+    if args.current:
+        with open(args.current, "r") as f:
+            result = json.load(f)
+    else:
+        result = run(args.only, args.eval_rows, args.latency_ms)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {len(result['metrics'])} metrics to {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, result, args.threshold)
+        print(format_comparison(rows))
+        regressions = [row for row in rows if row["regression"]]
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%} in {len(rows)} compared metrics")
+        exit(1 if regressions else 0)
+    elif not args.current:
+        for name, metric in result["metrics"].items():
+            print(f"{name:<60} {metric['value']:>12.4g} {metric['unit']}")
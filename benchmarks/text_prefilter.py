@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from tools.text_prefilter import detect_text, CLEAN, TEXT, CLEAN_MAX_SCORE, TEXT_MIN_SCORE, CONTRAST_THRESHOLD, CLEAN_MAX_EDGE_DENSITY
+from tools.pillow_renderer import load_font
+
+SIZES = [(300, 250), (728, 90), (160, 600), (970, 250), (1200, 628), (336, 280)]
+WORDS = ["SALE", "Summer", "Join us", "Shop now", "Fresh", "50% OFF", "Discover", "Limited offer", "Learn more", "New"]
+
+
+def _background(rng, width, height):
+    """
+    Text-free background: gradients, soft shapes, textures and photographic-like noise
+    """
+    kind = rng.choice(["gradient", "shapes", "texture", "stripes"])
+    y, x = np.mgrid[0:height, 0:width]
+    start, end = np.array(rng.sample(range(256), 3)), np.array(rng.sample(range(256), 3))
+    t = (x / width * rng.random() + y / height * rng.random())[..., None]
+    t = t / max(t.max(), 1e-6)
+    pixels = start * (1 - t) + end * t
+    if kind == "texture":
+        noise = np.asarray(Image.fromarray((np.random.default_rng(rng.getrandbits(32)).random((height // 8 + 1, width // 8 + 1)) * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC), dtype=float)
+        pixels = pixels * 0.6 + noise[..., None] * 0.4
+    elif kind == "stripes":
+        pixels = pixels + 40 * np.sin(x / rng.uniform(20, 80) + y / rng.uniform(20, 80))[..., None]
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    if kind == "shapes":
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(3, 10)):
+            cx, cy, r = rng.randrange(width), rng.randrange(height), rng.randint(20, max(21, min(width, height) // 2))
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=tuple(rng.sample(range(256), 3)))
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(2, 12)))
+    return image
+
+
+def _add_text(rng, image):
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    for _ in range(rng.randint(1, 3)):
+        size = rng.randint(max(10, min(width, height) // 14), max(12, min(width, height) // 4))
+        font = load_font(rng.choice(["DejaVuSans", "Arial", None]), size, rng.choice([None, "bold"]))
+        text = rng.choice(WORDS)
+        x, y = rng.randrange(0, max(1, width // 2)), rng.randrange(0, max(1, height - size))
+        luminance = np.asarray(image.crop((x, y, x + 10, y + 10)).convert("L")).mean()
+        color = (20, 20, 20) if luminance > 128 else (240, 240, 240)
+        draw.text((x, y), text, font=font, fill=color)
+    return image
+
+
+def synthetic_benchmark(n: int = 200, seed: int = 0):
+    """
+    n labeled (image, has_text) pairs, half of them with text drawn on top of the background
+    """
+    rng = random.Random(seed)
+    samples = []
+    for i in range(n):
+        width, height = rng.choice(SIZES)
+        image = _background(rng, width, height)
+        has_text = i % 2 == 1
+        if has_text:
+            image = _add_text(rng, image)
+        samples.append((image, has_text))
+    return samples
+
+
+def labeled_benchmark(labels_path: str):
+    """
+    Read {"image": path, "has_text": bool} rows, paths relative to the labels file
+    """
+    base = os.path.dirname(os.path.abspath(labels_path))
+    samples = []
+    with open(labels_path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                samples.append((os.path.join(base, row["image"]), bool(row["has_text"])))
+    return samples
+
+
+def evaluate(samples, clean_max_score=CLEAN_MAX_SCORE, text_min_score=TEXT_MIN_SCORE, contrast_threshold=CONTRAST_THRESHOLD,
+             clean_max_edge_density=CLEAN_MAX_EDGE_DENSITY) -> dict:
+    latencies, outcomes = [], []
+    for image, has_text in samples:
+        start = time.perf_counter()
+        result = detect_text(image, clean_max_score, text_min_score, contrast_threshold, clean_max_edge_density)
+        latencies.append(time.perf_counter() - start)
+        outcomes.append((result["verdict"], has_text))
+
+    passed = [has_text for verdict, has_text in outcomes if verdict == CLEAN]
+    flagged = [has_text for verdict, has_text in outcomes if verdict == TEXT]
+    with_text = sum(has_text for _, has_text in outcomes)
+    without_text = len(outcomes) - with_text
+    return {
+        "images": len(outcomes),
+        # The costly mistake is passing a background with text as clean
+        "clean_precision": round(1 - sum(passed) / len(passed), 3) if passed else None,
+        "clean_recall": round((len(passed) - sum(passed)) / without_text, 3) if without_text else None,
+        "text_precision": round(sum(flagged) / len(flagged), 3) if flagged else None,
+        "text_recall": round(sum(flagged) / with_text, 3) if with_text else None,
+        "missed_text": sum(passed),
+        "escalated_to_llm": sum(verdict not in (CLEAN, TEXT) for verdict, _ in outcomes),
+        "llm_calls_saved": round(1 - sum(verdict not in (CLEAN, TEXT) for verdict, _ in outcomes) / len(outcomes), 3),
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "latency_p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precision, recall and latency of the local text prefilter")
+    parser.add_argument("--labels", type=str, help='JSONL of {"image", "has_text"} rows, defaults to a synthetic set')
+    parser.add_argument("--n", type=int, default=200, help="Size of the synthetic set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clean_max_score", type=int, default=CLEAN_MAX_SCORE)
+    parser.add_argument("--text_min_score", type=int, default=TEXT_MIN_SCORE)
+    parser.add_argument("--contrast_threshold", type=float, default=CONTRAST_THRESHOLD)
+    parser.add_argument("--clean_max_edge_density", type=float, default=CLEAN_MAX_EDGE_DENSITY)
+    args = parser.parse_args()
+
+    samples = labeled_benchmark(args.labels) if args.labels else synthetic_benchmark(args.n, args.seed)
+    print(json.dumps(evaluate(samples, args.clean_max_score, args.text_min_score, args.contrast_threshold, args.clean_max_edge_density), indent=2))
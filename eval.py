@@ -1,187 +1,122 @@
-import os, argparse
-from langchain_openai import AzureChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, SystemMessage
-from tools.tool_utils import prepare_image_message, BOutput
-from dotenv import load_dotenv
-load_dotenv()
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--evaluator", type=str, help="gpt4o or claude", default="gpt4o")
-parser.add_argument("--metric", type=str, help="alignment, overlap, whitespace, qa", default="CPYQ")
-parser.add_argument("--image_file" , type=str, help="Path to the image to be evaluated")
-parser.add_argument("--logo_file", type=str, help="Path to the logo")
-parser.add_argument("--banner_request", type=str, help="The banner request")
-
-args = parser.parse_args()
-
-if args.evaluator == "gpt4o":
-    llm = AzureChatOpenAI(
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),  # or your deployment
-        api_version="2024-10-21",  # or your api version #  os.getenv("AZURE_OPENAI_VERSION")
-        temperature=0.3, 
-        max_tokens=2000,
-        max_retries=2,
-    )
-elif args.evaluator == "claude":
-    llm = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",  # or another Claude model version
-        anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
-        temperature=0.3,
-        max_tokens=200,  # or specify a limit
-        max_retries=2
-    )
-
-TAA ="""Definition: Measures how well the generated banner ad aligns with the given request, including the theme, target audience, and primary purpose.
-
-Instructions for Scoring:
-5 – Perfectly aligns with the request (theme, audience, purpose are all clearly reflected).
-4 – Mostly aligns, but minor details could be improved.
-3 – Somewhat aligns, but key elements are missing or unclear.
-2 – Barely aligns, with major missing or incorrect elements.
-1 – Does not align with the request at all.
-
-Justification Required: Explain how well the banner captures the requested theme and audience.
-"""
-
-LPS="""Definition: Evaluates whether the logo is well-integrated into the design in terms of visibility, size, and positioning.
-
-Instructions for Scoring:
-5 – Logo is well-placed, clearly visible, proportionate, and blends seamlessly.
-4 – Logo is well-placed but could be slightly improved (e.g., minor size or position adjustments).
-3 – Logo is visible but not ideally placed (e.g., too small, too large, or slightly obstructed).
-2 – Logo placement is poor (e.g., difficult to notice, awkward positioning).
-1 – Logo is either missing or completely misplaced.
-
-Justification Required: Explain how the logo is positioned and whether it contributes to brand identity.
-"""
-
-AQS="""Definition: Measures the visual appeal, including color harmony, layout balance, typography, and overall design quality.
-
-Instructions for Scoring:
-5 – Visually outstanding, professional design, well-balanced, with harmonious colors and readable text.
-4 – Well-designed, but small refinements could enhance it.
-3 – Acceptable but has notable design flaws (e.g., poor contrast, unbalanced elements).
-2 – Visually weak, with noticeable design mistakes.
-1 – Poor design, lacks professionalism or coherence.
-
-Justification Required: Explain what makes the design appealing or unappealing.
-"""
-
-CTAE="""Definition: Evaluates whether the Call-to-Action (CTA) is clear, engaging, and visually emphasized.
-
-Instructions for Scoring:
-5 – CTA is clear, compelling, well-placed, and visually prominent.
-4 – CTA is effective but could be slightly improved (e.g., contrast, size).
-3 – CTA is present but lacks emphasis or clarity.
-2 – CTA is weak, hard to notice, or poorly worded.
-1 – No clear CTA is present.
-
-Justification Required: Explain how effective the CTA is in prompting user action.
-"""
-
-CPYQ="""Definition: Evaluates the effectiveness of the headline, subheadline, and any other text in the banner ad, focusing on clarity, readability, persuasiveness, and grammatical correctness.
-
-Instructions for Scoring:
-5 – Copy is clear, engaging, grammatically correct, and persuasive, making the message effective.
-4 – Copy is well-written but could be slightly improved (e.g., minor word choice refinements).
-3 – Copy is somewhat effective but has issues in clarity, grammar, or persuasiveness.
-2 – Copy is weak, hard to read, contains noticeable grammatical mistakes, or lacks impact.
-1 – Copy is unclear, irrelevant, or difficult to read due to poor design or bad wording.
-
-Justification Required:
-Is the copy easy to read against the background?
-Does it match the banner’s purpose and target audience?
-Is it persuasive and action-driven?
-Are there any grammatical or spelling errors?
-"""
-
-BIS="""Definition: Measures how well the banner ad visually and stylistically aligns with the brand’s identity beyond just logo placement. This includes color consistency, typography, imagery, and overall brand feel.
-
-Instructions for Scoring:
-5 – Strong brand consistency; the banner design aligns well with the provided logo and conveys a recognizable brand identity.
-4 – Mostly aligns, but minor refinements could improve brand consistency.
-3 – Somewhat aligns, but noticeable inconsistencies exist (e.g., off-brand colors, incorrect typography).
-2 – Weak brand alignment, only the logo represents the brand while other design choices feel unrelated.
-1 – No brand identity is reflected; the banner appears generic or disconnected from the brand.
-
-Justification Required:
-Are the colors and typography in line with the brand’s usual style?
-Does the imagery and layout reinforce the brand’s visual identity?
-Does the overall aesthetic feel like it belongs to the brand, or does it look generic?
-"""
-
-BANNER_AD_REPORT_PROMPT = """You are an expert in advertising design, marketing, and visual communication. Your task is to evaluate a banner ad image based on the following principle given the advertiser's logo and banner request. You should rate on a scale of 1 to 5, where 1 is poor and 5 is excellent. You should also provide a brief justification for your score.
-
-{score_princple}
-
-Please start evaluating the banner ad image. Output your answer in the format of {{"score": , "explanation": "explain concisely why you gave this score"}}
-"""
-
-if args.metric == "TAA":
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=TAA)
-elif args.metric == "LPS":
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=LPS)
-elif args.metric == "AQS":  
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=AQS)
-elif args.metric == "CTAE":
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=CTAE)
-elif args.metric == "CPYQ":
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=CPYQ)
-elif args.metric == "BIS":
-    system_prompt = BANNER_AD_REPORT_PROMPT.format(score_princple=BIS)
-print(system_prompt)
-
-def run(image_path, logo_path, banner_request):
+import argparse, asyncio, json, os, sys
+
+from prompts.eval_prompt import parse_metrics, build_system_prompt, build_multi_metric_prompt
+from tools.tool_utils import IMAGE_FORMATS
+from tools.judgment_cache import JudgmentCache, DEFAULT_CACHE_PATH
+from tools.evaluator import Evaluator, CHAT_MODELS, agreement
+from tools.tracing import Tracer, set_tracer
+from tools.rate_limiter import Scheduler, set_scheduler, get_scheduler, DEFAULT_STATE_DIR
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluator", type=str, help=" or ".join(CHAT_MODELS), default="gpt4o")
+    parser.add_argument("--metric", type=str, help="TAA, LPS, AQS, CTAE, CPYQ, BIS, a comma separated list of them, or all", default="CPYQ")
+    parser.add_argument("--image_file" , type=str, help="Path to the image to be evaluated")
+    parser.add_argument("--logo_file", type=str, help="Path to the logo")
+    parser.add_argument("--banner_request", type=str, help="The banner request")
+    parser.add_argument("--manifest", type=str, help="JSONL of {image_file, logo_file, banner_request, metric} rows for batch mode")
+    parser.add_argument("--output", type=str, help="JSONL file the batch results are streamed to", default="eval_results.jsonl")
+    parser.add_argument("--concurrency", type=int, help="Maximum number of in-flight requests in batch mode", default=8)
+    parser.add_argument("--multi_metric", action="store_true", help="Judge all requested metrics of a banner in one multimodal call")
+    parser.add_argument("--check_agreement", action="store_true", help="Score in both multi-metric and per-metric mode and report how closely they agree")
+    parser.add_argument("--cache_path", type=str, help="SQLite file caching judgments across runs", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--no_cache", action="store_true", help="Always call the evaluator, ignoring and not updating the judgment cache")
+    parser.add_argument("--cache_max_age_days", type=float, help="Prune cached judgments older than this before running")
+    parser.add_argument("--cache_max_mb", type=float, help="Prune least recently used cached judgments beyond this size before running")
+    parser.add_argument("--image_max_edge", type=str, help="Downscale images so their longest edge is at most this many pixels, or 'auto' for the evaluator's limit")
+    parser.add_argument("--image_format", type=str, choices=list(IMAGE_FORMATS), help="Re-encode images in this format before sending them")
+    parser.add_argument("--image_quality", type=int, help="Quality for webp/jpeg re-encoding", default=85)
+    parser.add_argument("--trace", type=str, help="JSONL or .parquet file recording latency, tokens and cost of every call")
+    parser.add_argument("--rate_limit", action="store_true", help="Schedule calls through the rate limiter shared by all processes on this host")
+    parser.add_argument("--rate_limit_dir", type=str, help="Directory of the shared rate limiter state", default=DEFAULT_STATE_DIR)
+    return parser.parse_args(argv)
+
+
+def open_cache(args):
+    if args.no_cache:
+        return None
+    cache = JudgmentCache(args.cache_path)
+    if args.cache_max_age_days is not None or args.cache_max_mb is not None:
+        print(f"Pruned {cache.prune(args.cache_max_age_days, args.cache_max_mb)} cached judgments")
+    return cache
+
+
+def build_evaluator(args, cache=None):
+    max_edge = args.image_max_edge
+    if max_edge is not None and max_edge != "auto":
+        max_edge = int(max_edge)
+    image_options = {"max_edge": max_edge, "image_format": args.image_format, "quality": args.image_quality}
+    return Evaluator(args.evaluator, cache=cache, image_options=image_options)
+
+
+def run(args):
+    image_path, logo_path, banner_request = args.image_file, args.logo_file, args.banner_request
     print(f"Processing {image_path}")
     print(f"Processing {logo_path}")
     print(banner_request)
     if not os.path.isfile(image_path):
         print(f"error: Skipping {image_path}")
-        exit(4)
+        sys.exit(4)
     if not os.path.isfile(logo_path):
-        print(f"error: Skipping {image_path}")
-        exit(4)
-    image_data = prepare_image_message(image_path)
-    logo_data = prepare_image_message(logo_path)
-    planning_messages = [
-        SystemMessage(content=system_prompt),
-    HumanMessage(content=[
-        {
-            "type": "text", 
-            "text": "The banner image to be evaluated is:"
-        },
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": image_data
-            }
-        },
-        {
-            "type": "text", 
-            "text": "For your reference, the advertiser logo is:"
-        },
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": logo_data
-            }
-        },
-        {
-            "type": "text", 
-            "text": f"For your reference, the advertiser banner request is: {banner_request}"
-        }
-        ])
-    ]
+        print(f"error: Skipping {logo_path}")
+        sys.exit(4)
+    metrics = parse_metrics(args.metric)
+    multi_metric = args.multi_metric or args.check_agreement
+    if multi_metric:
+        print(build_multi_metric_prompt(metrics))
+    else:
+        for metric in metrics:
+            print(build_system_prompt(metric))
+    cache = open_cache(args)
+    evaluator = build_evaluator(args, cache)
 
     try:
-        response = llm.with_structured_output(BOutput).invoke(planning_messages).model_dump()
-        response_ = {"score": response["score"], "explanation": response["explanation"]}
+        response = evaluator.score(image_path, logo_path, banner_request, metrics, multi_metric)
+        if args.check_agreement:
+            reference = evaluator.score(image_path, logo_path, banner_request, metrics)
+            print(json.dumps(agreement([response[m]["score"] for m in metrics], [reference[m]["score"] for m in metrics]), indent=2))
     except Exception as e:
         print(f"Error processing")
         print(e)
-    print(response_)
+        sys.exit(5)
+    finally:
+        if cache is not None:
+            cache.close()
+    print(response[metrics[0]] if len(metrics) == 1 else response)
+
+
+def run_batch(args):
+    cache = open_cache(args)
+    evaluator = build_evaluator(args, cache)
+    try:
+        stats = asyncio.run(evaluator.run_batch(
+            args.manifest, args.output, args.concurrency,
+            multi_metric=args.multi_metric, check_agreement=args.check_agreement, default_metric=args.metric,
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
+    if get_scheduler() is not None:
+        stats["rate_limits"] = get_scheduler().stats()
+    print(json.dumps(stats, indent=2))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tracer = Tracer(args.trace) if args.trace else None
+    set_tracer(tracer)
+    if args.rate_limit:
+        set_scheduler(Scheduler(state_dir=args.rate_limit_dir))
+    try:
+        if args.manifest:
+            run_batch(args)
+        else:
+            run(args)
+    finally:
+        if tracer is not None:
+            tracer.close()
 
 
 if __name__ == "__main__":
-    run(args.image_file, args.logo_file, args.banner_request)
\ No newline at end of file
+    main()
@@ -45,4 +45,8 @@ background_designer_context_prompt = """
     Banner Objectives:
     - Primary Purpose: {purpose}
     - Target Audience: {audience}
-    - Mood and Tone: {mood}"""
\ No newline at end of file
+    - Mood and Tone: {mood}"""
+
+background_library_prompt = """Text-free backgrounds generated for earlier, similar requests are available (tools/background_library.py). Each comes with the description it was generated from:
+{candidates}
+If one of them suits the objectives, user requirements and logo, return its path as the final image path together with its description and size instead of generating a new background, and skip the text check. Only generate a new background when none of them fits."""
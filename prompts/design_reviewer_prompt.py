@@ -12,4 +12,10 @@ system_prompt = """Suppose you are an experienced marketing professional in the
                 - You can also propose better copywrite if you find it necessary.
                 - Use the provided history of previous iterations if it is not the first iteration. Avoid generating FEEDBACK identical with the FEEDBACK in previous rounds unless the issues raised before have not been solved. Ensure your FEEDBACK build on past refinements.
                 - Avoid any code blocks in your response. Use clear and concise human language.
-                - Spot the most critical issues first."""
\ No newline at end of file
+                - Spot the most critical issues first."""
+
+geometry_findings_prompt = """An automatic geometry check (tools/layout_validator.py) measured the current layout and found the issues below. They are exact, so there is no need to verify them visually; include them in your FEEDBACK and spend your review on what geometry cannot judge.
+{findings}"""
+
+history_prompt = """History of previous iterations, oldest first. Each FEEDBACK item is marked addressed when it was not raised again after a refinement, or open with how often it has been raised. Layout changes list what the refinement actually changed. Items under "Do not suggest again" have been raised for over two iterations without being solved, leave them out of your FEEDBACK.
+{history}"""
@@ -1,9 +1,8 @@
 
 import json
-with open('.layout_demonstrations.json', 'r') as f:
-    layout_demonstrations = json.load(f)
-    
-foreground_designer_system_prompt = f"""You are a textual director specialized in banner layout and typography. Your role is to create precise, varied layouts that follow established design patterns while maintaining visual hierarchy and readability.
+from tools.demonstration_index import DEMONSTRATIONS_PATH, select_demonstrations, serialize_demonstrations
+
+foreground_designer_instructions = """You are a textual director specialized in banner layout and typography. Your role is to create precise, varied layouts that follow established design patterns while maintaining visual hierarchy and readability.
 
 LAYOUT PATTERNS AND IMPLEMENTATION:
 
@@ -176,9 +175,24 @@ IMPLEMENTATION GUIDELINES:
 Always document your layout rationale and ensure all positions are precisely specified in pixels or percentages.
 
 Below are the examples for major layout styles:
-{json.dumps(layout_demonstrations, indent=2)}
 """
 
+def build_foreground_designer_system_prompt(width=None, height=None, pattern=None, k=3, path=DEMONSTRATIONS_PATH):
+    """
+    Foreground designer system prompt with the k demonstrations most relevant to the banner size (and layout pattern, if chosen).
+    Without a size, or with k=None, every demonstration is included as before.
+    """
+    if width is None or height is None or k is None:
+        with open(path, 'r') as f:
+            return foreground_designer_instructions + json.dumps(json.load(f), indent=2) + "\n"
+    return foreground_designer_instructions + serialize_demonstrations(select_demonstrations(width, height, pattern, k, path)) + "\n"
+
+def __getattr__(name):
+    # The full prompt used to be built when this module was imported; it is now read from disk only when asked for
+    if name == "foreground_designer_system_prompt":
+        return build_foreground_designer_system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 foreground_designer_context_prompt = """
     Analyze this banner background image ({width}x{height}px) as required and take the following into consideration.  
 
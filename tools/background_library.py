@@ -0,0 +1,350 @@
+"""
+Library of accepted (text-free) generated backgrounds, so the background designer can reuse one for a similar request
+instead of generating and text-checking a new one.
+
+Each background is stored with its size, the description passed to text_to_image_generation_tool_size_specified,
+a dominant-color palette and a perceptual hash. find() ranks stored backgrounds by size (exact, or the same aspect
+ratio to resize), description similarity and contrast with the logo's colors, and skips near-duplicates.
+
+    library = BackgroundLibrary()
+    candidates = library.find(300, 250, description, logo="logo.png")
+    if not candidates:
+        path = generate(...)  # text_to_image_generation_tool_size_specified + text_checker
+        library.add(path, description)
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from tools.tool_utils import file_digest
+
+DEFAULT_LIBRARY_DIR = os.path.join(".cache", "backgrounds")
+PALETTE_COLORS = 5
+# Hamming distance between 64-bit dHashes below which two backgrounds of one size count as the same image
+DUPLICATE_DISTANCE = 6
+# Relative aspect ratio difference a stored background can be resized across
+ASPECT_TOLERANCE = 0.02
+MIN_SIMILARITY = 0.35
+# Logo-to-background color contrast (0-1) below which a background is not offered, e.g. a white logo on white
+MIN_CONTRAST = 0.25
+# CIELAB distance treated as full contrast
+CONTRAST_DELTA_E = 50.0
+VECTOR_DIM = 2048
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+STOPWORDS = {"the", "and", "a", "an", "of", "with", "in", "on", "to", "for", "by", "at", "is", "are", "its", "that",
+             "this", "as", "from", "into", "background", "image"}
+
+
+def _pixels(image, max_edge: int = 64) -> np.ndarray:
+    """
+    RGB pixels of a thumbnail, without the transparent ones
+    """
+    image = Image.open(image) if isinstance(image, str) else image
+    image = image.convert("RGBA")
+    image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    rgba = np.asarray(image).reshape(-1, 4)
+    opaque = rgba[rgba[:, 3] > 128, :3]
+    return opaque if len(opaque) else rgba[:, :3]
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """
+    CIELAB (D65) of an (N, 3) array of 0-255 sRGB colors
+    """
+    c = np.asarray(rgb, dtype=float) / 255
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([[0.4124, 0.2126, 0.0193], [0.3576, 0.7152, 0.1192], [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def dominant_palette(image, colors: int = PALETTE_COLORS) -> list:
+    """
+    Up to `colors` dominant colors as [[r, g, b, share], ...], most common first. Transparent pixels are ignored.
+    """
+    pixels = _pixels(image)
+    quantized = Image.fromarray(pixels.reshape(1, -1, 3).astype(np.uint8)).quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    counts = np.bincount(np.asarray(quantized).reshape(-1), minlength=colors)
+    palette = np.array(quantized.getpalette()[:3 * colors]).reshape(-1, 3)
+    order = [i for i in np.argsort(-counts) if counts[i]]
+    return [[*map(int, palette[i]), round(float(counts[i] / counts.sum()), 4)] for i in order]
+
+
+def palette_contrast(logo_palette: list, background_palette: list) -> float:
+    """
+    How well the logo's colors stand out from the background's, 0-1: the share-weighted CIELAB distance between
+    every logo and background color, capped at CONTRAST_DELTA_E
+    """
+    logo, background = np.array(logo_palette, dtype=float), np.array(background_palette, dtype=float)
+    distance = np.linalg.norm(rgb_to_lab(logo[:, :3])[:, None] - rgb_to_lab(background[:, :3])[None], axis=2)
+    weights = logo[:, 3][:, None] * background[:, 3][None]
+    return float((weights * np.minimum(distance / CONTRAST_DELTA_E, 1)).sum() / weights.sum())
+
+
+def perceptual_hash(image) -> int:
+    """
+    64-bit difference hash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour
+    """
+    image = Image.open(image) if isinstance(image, str) else image
+    gray = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    return np.unpackbits((hashes ^ np.uint64(value)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def description_vector(description: str) -> np.ndarray:
+    """
+    Unit-length hashed bag of words of a background description, for cosine similarity
+    """
+    vector = np.zeros(VECTOR_DIM)
+    words = [word for word in WORD_PATTERN.findall(description.lower()) if word not in STOPWORDS and len(word) > 2]
+    for word in words:
+        vector[zlib.crc32(word.encode("utf-8")) % VECTOR_DIM] += 1
+    vector = np.log1p(vector)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class BackgroundLibrary:
+    """
+    SQLite index of stored backgrounds under library_dir, with the images copied next to it by content hash.
+    Lookups run against an in-memory copy of the index, rebuilt after every change.
+    """
+
+    def __init__(self, library_dir: str = DEFAULT_LIBRARY_DIR):
+        self.library_dir = library_dir
+        os.makedirs(library_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(library_dir, "library.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS backgrounds (
+                digest TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                palette TEXT NOT NULL,
+                phash TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS backgrounds_accessed ON backgrounds (accessed_at)")
+        self._index = None
+
+    def _load_index(self) -> dict:
+        if self._index is None:
+            rows = self._conn.execute("SELECT digest, path, width, height, description, palette, phash FROM backgrounds").fetchall()
+            self._index = {
+                "digest": [row[0] for row in rows],
+                "path": [row[1] for row in rows],
+                "size": np.array([(row[2], row[3]) for row in rows], dtype=float).reshape(-1, 2),
+                "description": [row[4] for row in rows],
+                "palette": [json.loads(row[5]) for row in rows],
+                "phash": np.array([int(row[6], 16) for row in rows], dtype=np.uint64),
+                "vectors": np.array([description_vector(row[4]) for row in rows]).reshape(-1, VECTOR_DIM),
+            }
+        return self._index
+
+    def add(self, image_path: str, description: str, check_text: bool = True) -> dict:
+        """
+        Store an accepted background. Returns {"added", "digest", "path"}; nothing is added when the image is a
+        near-duplicate of a stored background of the same size (the stored one is returned), or when check_text is
+        on and tools.text_prefilter finds text in it.
+        """
+        if check_text:
+            from tools.text_prefilter import TEXT, detect_text
+            if detect_text(image_path)["verdict"] == TEXT:
+                return {"added": False, "reason": "text", "digest": None, "path": None}
+        with Image.open(image_path) as image:
+            width, height = image.size
+            phash = perceptual_hash(image)
+            palette = dominant_palette(image)
+        with self._lock:
+            index = self._load_index()
+            same_size = np.nonzero((index["size"][:, 0] == width) & (index["size"][:, 1] == height))[0]
+            if len(same_size):
+                distances = _hamming(index["phash"][same_size], phash)
+                nearest = same_size[int(np.argmin(distances))]
+                if distances.min() <= DUPLICATE_DISTANCE:
+                    return {"added": False, "reason": "duplicate", "digest": index["digest"][nearest], "path": index["path"][nearest]}
+            digest = file_digest(image_path)
+            stored = os.path.join(self.library_dir, digest[:2], digest + os.path.splitext(image_path)[1].lower())
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            shutil.copyfile(image_path, stored)
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO backgrounds (digest, path, width, height, description, palette, phash, bytes, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, stored, width, height, description, json.dumps(palette), f"{phash:016x}", os.path.getsize(stored), now, now),
+            )
+            self._index = None
+        return {"added": True, "digest": digest, "path": stored}
+
+    def find(self, width: int, height: int, description: str, logo=None, k: int = 3,
+             min_similarity: float = MIN_SIMILARITY, min_contrast: float = MIN_CONTRAST) -> list:
+        """
+        Up to k stored backgrounds for a banner size and background description, best first. Backgrounds must have
+        the exact size or the same aspect ratio (then "resize" is True), a description similarity of at least
+        min_similarity and, when a logo image or palette is given, a color contrast with it of at least min_contrast.
+        Near-duplicates of a better candidate are skipped.
+        """
+        with self._lock:
+            index = self._load_index()
+            if not len(index["digest"]):
+                return []
+            sizes = index["size"]
+            aspect = np.abs(sizes[:, 0] / sizes[:, 1] / (width / height) - 1)
+            exact = (sizes[:, 0] == width) & (sizes[:, 1] == height)
+            similarity = index["vectors"] @ description_vector(description)
+            eligible = (exact | (aspect <= ASPECT_TOLERANCE)) & (similarity >= min_similarity)
+            contrast = np.ones(len(sizes))
+            if logo is not None:
+                logo_palette = dominant_palette(logo) if isinstance(logo, str) else logo
+                for i in np.nonzero(eligible)[0]:
+                    contrast[i] = palette_contrast(logo_palette, index["palette"][i])
+                eligible &= contrast >= min_contrast
+            # Exact sizes first among equally similar backgrounds, contrast breaks ties
+            score = similarity + 0.05 * exact + 0.1 * contrast
+            candidates, chosen = [], []
+            for i in sorted(np.nonzero(eligible)[0], key=lambda i: -score[i]):
+                if chosen and _hamming(index["phash"][chosen], int(index["phash"][i])).min() <= DUPLICATE_DISTANCE:
+                    continue
+                chosen.append(i)
+                candidates.append({
+                    "path": index["path"][i],
+                    "description": index["description"][i],
+                    "width": int(sizes[i, 0]),
+                    "height": int(sizes[i, 1]),
+                    "resize": not bool(exact[i]),
+                    "similarity": round(float(similarity[i]), 3),
+                    "contrast": round(float(contrast[i]), 3),
+                    "palette": index["palette"][i],
+                })
+                if len(candidates) >= k:
+                    break
+        return candidates
+
+    def use(self, path: str, width: int = None, height: int = None) -> str:
+        """
+        Mark a stored background as reused and return its path, resized to width x height when given. Resized
+        variants are kept next to the stored file and count towards its bytes, so prune(max_mb) sees them.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE backgrounds SET uses = uses + 1, accessed_at = ? WHERE path = ?", (time.time(), path))
+        if width is None or height is None:
+            return path
+        with Image.open(path) as image:
+            if image.size == (width, height):
+                return path
+            resized_path = f"{os.path.splitext(path)[0]}_{width}x{height}.png"
+            if os.path.exists(resized_path):
+                return resized_path
+            image.convert("RGB").resize((width, height), Image.LANCZOS).save(resized_path)
+        with self._lock:
+            self._conn.execute("UPDATE backgrounds SET bytes = bytes + ? WHERE path = ?", (os.path.getsize(resized_path), path))
+        return resized_path
+
+    def prune(self, max_mb: float = None, max_entries: int = None, max_age_days: float = None) -> int:
+        """
+        Remove backgrounds created more than max_age_days ago, then the least recently used ones until at most
+        max_entries backgrounds taking at most max_mb remain. Their files are deleted too. Returns the number removed.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT digest, path, bytes, created_at FROM backgrounds ORDER BY accessed_at DESC").fetchall()
+            cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+            budget = max_mb * 1024 * 1024 if max_mb is not None else None
+            stale, kept, total = [], 0, 0
+            for digest, path, size, created_at in rows:
+                if (cutoff is not None and created_at < cutoff) or (max_entries is not None and kept >= max_entries) \
+                        or (budget is not None and total + size > budget):
+                    stale.append((digest, path))
+                    continue
+                kept += 1
+                total += size
+            for digest, path in stale:
+                base = os.path.splitext(path)[0]
+                for stored in [path] + [os.path.join(os.path.dirname(path), name) for name in os.listdir(os.path.dirname(path))
+                                        if name.startswith(os.path.basename(base) + "_")]:
+                    if os.path.exists(stored):
+                        os.remove(stored)
+            self._conn.executemany("DELETE FROM backgrounds WHERE digest = ?", [(digest,) for digest, _ in stale])
+            if stale:
+                self._index = None
+        return len(stale)
+
+    def stats(self) -> dict:
+        """
+        Stored backgrounds, their size on disk including resized variants, and how often they were reused
+        """
+        with self._lock:
+            entries, size, uses = self._conn.execute("SELECT count(*), coalesce(sum(bytes), 0), coalesce(sum(uses), 0) FROM backgrounds").fetchone()
+        return {"library_dir": self.library_dir, "entries": entries, "stored_mb": round(size / 1024 / 1024, 3), "reuses": uses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_candidates(candidates: list) -> str:
+    """
+    Candidates as lines for background_library_prompt
+    """
+    return "\n".join(
+        f"- {c['path']} ({c['width']}x{c['height']}{', to be resized' if c['resize'] else ''}, similarity {c['similarity']}): {c['description']}"
+        for c in candidates
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store, look up and prune reusable generated backgrounds")
+    parser.add_argument("--library_dir", type=str, default=DEFAULT_LIBRARY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Store an accepted background")
+    add.add_argument("image", type=str)
+    add.add_argument("--description", type=str, required=True, help="The description the background was generated from")
+    add.add_argument("--no_text_check", action="store_true", help="Store the image without the local text check")
+    find = commands.add_parser("find", help="Look up backgrounds for a banner")
+    find.add_argument("--width", type=int, required=True)
+    find.add_argument("--height", type=int, required=True)
+    find.add_argument("--description", type=str, required=True)
+    find.add_argument("--logo", type=str, help="Logo image the background has to contrast with")
+    find.add_argument("--k", type=int, default=3)
+    find.add_argument("--min_similarity", type=float, default=MIN_SIMILARITY)
+    prune = commands.add_parser("prune", help="Evict least recently used backgrounds")
+    prune.add_argument("--max_mb", type=float)
+    prune.add_argument("--max_entries", type=int)
+    prune.add_argument("--max_age_days", type=float)
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    library = BackgroundLibrary(args.library_dir)
+    if args.command == "add":
+        print(json.dumps(library.add(args.image, args.description, not args.no_text_check)))
+    elif args.command == "find":
+        start = time.perf_counter()
+        candidates = library.find(args.width, args.height, args.description, args.logo, args.k, args.min_similarity)
+        for candidate in candidates:
+            print(json.dumps(candidate))
+        print(f"Found {len(candidates)} candidates in {(time.perf_counter() - start) * 1000:.1f}ms")
+    elif args.command == "prune":
+        print(f"Removed {library.prune(args.max_mb, args.max_entries, args.max_age_days)} backgrounds")
+    print(json.dumps(library.stats(), indent=2))
+    library.close()
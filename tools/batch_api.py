@@ -0,0 +1,387 @@
+"""
+Provider batch APIs for large offline evaluations: about half the price of interactive calls, and they do not compete
+with live traffic for rate limits.
+
+    export:   turn an eval manifest into OpenAI/Azure batch JSONL or Anthropic message-batch request files, chunked
+              under the provider limits, plus an id map from each custom_id back to its manifest rows
+    ingest:   validate the provider result files against BOutput and write the usual eval result rows, with a retry
+              manifest of the rows that failed
+    simulate: write provider-format result files for exported requests with synthetic judgments, to try ingest offline
+
+    python -m tools.batch_api export --evaluator claude --manifest manifest.jsonl --metric all --output_dir batches/claude
+    python -m tools.batch_api ingest --batch_dir batches/claude results/*.jsonl --output results_claude.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import time
+from functools import lru_cache
+
+from pydantic import ValidationError
+
+from prompts.eval_prompt import build_system_prompt, build_multi_metric_prompt
+from tools.evaluator import build_messages, load_manifest
+from tools.tool_utils import prepare_image_message, BOutput, multi_output_model, IMAGE_FORMATS, PROVIDER_MAX_EDGE
+
+# Request settings of the --evaluator chat models in tools/evaluator.py, as batch request bodies
+BATCH_MODELS = {
+    "gpt4o": lambda: {"provider": "openai", "model": os.getenv("AZURE_OPENAI_DEPLOYMENT") or "gpt-4o", "temperature": 0.3, "max_tokens": 2000},
+    "claude": lambda: {"provider": "anthropic", "model": "claude-3-5-sonnet-20241022", "temperature": 0.3, "max_tokens": 200},
+}
+# Batch line "url" of the OpenAI-style platforms: Azure OpenAI (the gpt4o evaluator's deployment) and OpenAI itself
+BATCH_URLS = {"azure": "/chat/completions", "openai": "/v1/chat/completions"}
+# Requests and bytes per batch input file
+BATCH_LIMITS = {
+    "openai": {"max_requests": 50_000, "max_bytes": 200 * 1024 * 1024},
+    "anthropic": {"max_requests": 100_000, "max_bytes": 256 * 1024 * 1024},
+}
+# Multi-metric answers carry one explanation per metric
+MULTI_METRIC_MAX_TOKENS = 1200
+
+
+@lru_cache(maxsize=64)
+def output_schema(metrics: tuple):
+    return BOutput if len(metrics) == 1 else multi_output_model(list(metrics))
+
+
+def _openai_body(settings: dict, messages, schema) -> dict:
+    return {
+        "model": settings["model"],
+        "messages": [{"role": "system" if message.type == "system" else "user", "content": message.content} for message in messages],
+        "temperature": settings["temperature"],
+        "max_tokens": settings["max_tokens"],
+        # Structured output through a forced tool call, as with_structured_output does
+        "tools": [{"type": "function", "function": {"name": schema.__name__, "description": schema.__doc__, "parameters": schema.model_json_schema()}}],
+        "tool_choice": {"type": "function", "function": {"name": schema.__name__}},
+    }
+
+
+def _anthropic_part(part: dict) -> dict:
+    if part["type"] != "image_url":
+        return part
+    header, data = part["image_url"]["url"].split(",", 1)
+    return {"type": "image", "source": {"type": "base64", "media_type": header[len("data:"):].split(";")[0], "data": data}}
+
+
+def _anthropic_params(settings: dict, messages, schema) -> dict:
+    system, user = messages
+    return {
+        "model": settings["model"],
+        "max_tokens": settings["max_tokens"],
+        "temperature": settings["temperature"],
+        "system": system.content,
+        "messages": [{"role": "user", "content": [_anthropic_part(part) for part in user.content]}],
+        "tools": [{"name": schema.__name__, "description": schema.__doc__, "input_schema": schema.model_json_schema()}],
+        "tool_choice": {"type": "tool", "name": schema.__name__},
+    }
+
+
+def batch_request(settings: dict, custom_id: str, metrics: list, image_data: str, logo_data: str, banner_request: str) -> dict:
+    """
+    One line of a batch input file, judging the given metrics of a banner in one request
+    """
+    schema = output_schema(tuple(metrics))
+    system_prompt = build_system_prompt(metrics[0]) if len(metrics) == 1 else build_multi_metric_prompt(metrics)
+    messages = build_messages(system_prompt, image_data, logo_data, banner_request)
+    if len(metrics) > 1:
+        settings = {**settings, "max_tokens": max(settings["max_tokens"], MULTI_METRIC_MAX_TOKENS)}
+    if settings["provider"] == "anthropic":
+        return {"custom_id": custom_id, "params": _anthropic_params(settings, messages, schema)}
+    return {"custom_id": custom_id, "method": "POST", "url": settings["url"], "body": _openai_body(settings, messages, schema)}
+
+
+class _ChunkWriter:
+    """
+    Batch input files of at most max_requests lines and max_bytes bytes each
+    """
+
+    def __init__(self, output_dir: str, max_requests: int, max_bytes: int):
+        self.output_dir = output_dir
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self._file = None
+        self._requests = self._bytes = 0
+
+    def write(self, line: bytes) -> str:
+        if len(line) > self.max_bytes:
+            raise ValueError(f"A single request of {len(line)} bytes exceeds the {self.max_bytes} byte batch file limit")
+        if self._file is None or self._requests >= self.max_requests or self._bytes + len(line) > self.max_bytes:
+            self.close()
+            self.chunks.append(f"requests_{len(self.chunks):03d}.jsonl")
+            self._file = open(os.path.join(self.output_dir, self.chunks[-1]), "wb")
+            self._requests = self._bytes = 0
+        self._file.write(line)
+        self._requests += 1
+        self._bytes += len(line)
+        return self.chunks[-1]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def export_batch(manifest_path: str, output_dir: str, evaluator: str = "gpt4o", default_metric: str = "CPYQ",
+                 multi_metric: bool = False, image_options: dict = None, max_requests: int = None, max_mb: float = None,
+                 platform: str = "azure") -> dict:
+    """
+    Write batch input files for every manifest row to output_dir, together with batch.json (evaluator, provider,
+    chunk files) and ids.jsonl mapping each custom_id to its manifest rows. With multi_metric, rows for the same
+    banner share one request. Rows whose files or fields are missing get no request; they are kept in the id map with their
+    error so that ingest puts them in the retry manifest. platform picks the OpenAI-style endpoint, "azure" or
+    "openai"; OpenAI requests name the model instead of the Azure deployment.
+    """
+    if evaluator not in BATCH_MODELS:
+        raise ValueError(f"No batch API for evaluator {evaluator}, choose from {', '.join(BATCH_MODELS)}")
+    settings = BATCH_MODELS[evaluator]()
+    if settings["provider"] == "openai":
+        if platform not in BATCH_URLS:
+            raise ValueError(f"Unknown platform {platform}, choose from {', '.join(BATCH_URLS)}")
+        settings["url"] = BATCH_URLS[platform]
+        if platform == "openai":
+            settings["model"] = "gpt-4o"
+    limits = BATCH_LIMITS[settings["provider"]]
+    image_options = dict(image_options or {})
+    if image_options.get("max_edge") == "auto":
+        image_options["max_edge"] = PROVIDER_MAX_EDGE.get(evaluator)
+
+    groups = {}
+    for i, row in enumerate(load_manifest(manifest_path, default_metric)):
+        key = (row.get("image_file"), row.get("logo_file"), row.get("banner_request")) if multi_metric else i
+        groups.setdefault(key, []).append(row)
+
+    os.makedirs(output_dir, exist_ok=True)
+    writer = _ChunkWriter(output_dir, max_requests or limits["max_requests"],
+                          int(max_mb * 1024 * 1024) if max_mb else limits["max_bytes"])
+    requests, skipped = 0, 0
+    start = time.perf_counter()
+    with open(os.path.join(output_dir, "ids.jsonl"), "w") as ids:
+        for i, rows in enumerate(groups.values()):
+            metrics = list(dict.fromkeys(row["metric"] for row in rows))
+            entry = {"custom_id": f"{i:06d}-{'-'.join(metrics)}", "metrics": metrics, "rows": rows}
+            first = rows[0]
+            try:
+                for path in (first["image_file"], first["logo_file"]):
+                    if not os.path.isfile(path):
+                        raise FileNotFoundError(path)
+                image_data = prepare_image_message(first["image_file"], **image_options)
+                logo_data = prepare_image_message(first["logo_file"], **image_options)
+                request = batch_request(settings, entry["custom_id"], metrics, image_data, logo_data, first["banner_request"])
+                entry["chunk"] = writer.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+                requests += 1
+            except (KeyError, OSError, ValueError) as e:
+                entry["error"] = f"{type(e).__name__}: {e}"
+                skipped += 1
+                print(f"error: {first.get('image_file')}: {entry['error']}")
+            ids.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    writer.close()
+
+    meta = {
+        "evaluator": evaluator,
+        "provider": settings["provider"],
+        "platform": platform if settings["provider"] == "openai" else None,
+        "model": settings["model"],
+        "manifest": manifest_path,
+        "multi_metric": multi_metric,
+        "image_options": image_options,
+        "chunks": writer.chunks,
+        "requests": requests,
+        "skipped": skipped,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(output_dir, "batch.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    meta["wall_time_s"] = round(time.perf_counter() - start, 3)
+    return meta
+
+
+def _openai_result(line: dict):
+    """
+    (tool arguments, error) of one OpenAI/Azure batch output or error file line
+    """
+    if line.get("error"):
+        return None, f"{line['error'].get('code')}: {line['error'].get('message')}"
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code") != 200:
+        return None, f"HTTP {response.get('status_code')}: {(body.get('error') or {}).get('message')}"
+    message = body["choices"][0]["message"]
+    if message.get("tool_calls"):
+        return json.loads(message["tool_calls"][0]["function"]["arguments"]), None
+    return json.loads(message.get("content") or "null"), None
+
+
+def _anthropic_result(line: dict):
+    """
+    (tool input, error) of one Anthropic message-batch result line
+    """
+    result = line["result"]
+    if result["type"] != "succeeded":
+        error = (result.get("error") or {}).get("error") or {}
+        return None, f"{result['type']}: {error.get('message', '')}".rstrip(": ")
+    for block in result["message"]["content"]:
+        if block["type"] == "tool_use":
+            return block["input"], None
+    return None, f"No tool_use block, stop_reason {result['message'].get('stop_reason')}"
+
+
+def parse_result(line: dict, metrics: list):
+    """
+    ({metric: {"score", "explanation"}}, error) of a provider result line, validated against the output schema
+    """
+    try:
+        arguments, error = _anthropic_result(line) if "result" in line else _openai_result(line)
+        if error is not None:
+            return None, error
+        response = output_schema(tuple(metrics)).model_validate(arguments)
+    except (ValidationError, ValueError, KeyError, IndexError, TypeError) as e:
+        return None, f"{type(e).__name__}: {e}"
+    return ({metrics[0]: response.model_dump()} if len(metrics) == 1 else response.scores()), None
+
+
+def ingest_batch(batch_dir: str, result_paths: list, output_path: str, retry_path: str = None) -> dict:
+    """
+    Write one eval result row per manifest row of an exported batch: the row with its evaluator, custom_id and
+    score/explanation, or its error when the request failed, was not valid or has no result at all.
+    The manifest rows of failed requests go to retry_path, ready for another export or eval.py --manifest.
+    A custom_id with several results (e.g. a resubmitted retry) keeps a successful one.
+    """
+    with open(os.path.join(batch_dir, "batch.json"), "r") as f:
+        meta = json.load(f)
+    entries = {}
+    with open(os.path.join(batch_dir, "ids.jsonl"), "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["custom_id"]] = entry
+
+    outcomes, unknown = {}, 0
+    for path in result_paths:
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                line = json.loads(line)
+                entry = entries.get(line.get("custom_id"))
+                if entry is None:
+                    unknown += 1
+                    continue
+                scores, error = parse_result(line, entry["metrics"])
+                if scores is not None or entry["custom_id"] not in outcomes or outcomes[entry["custom_id"]][0] is None:
+                    outcomes[entry["custom_id"]] = (scores, error)
+
+    stats = {"requests": len(entries), "rows": 0, "succeeded": 0, "failed": 0, "missing": 0, "unknown_ids": unknown}
+    retry = []
+    with open(output_path, "w") as out:
+        for custom_id, entry in entries.items():
+            scores, error = outcomes.get(custom_id, (None, entry.get("error") or "Missing from batch results"))
+            if custom_id not in outcomes and "error" not in entry:
+                stats["missing"] += 1
+            elif scores is None:
+                stats["failed"] += 1
+            else:
+                stats["succeeded"] += 1
+            for row in entry["rows"]:
+                result = {**row, "evaluator": meta["evaluator"], "custom_id": custom_id}
+                if scores is None:
+                    result["error"] = error
+                    retry.append(row)
+                else:
+                    result.update(scores[row["metric"]])
+                result["cached"] = False
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                stats["rows"] += 1
+    if retry_path and retry:
+        with open(retry_path, "w") as f:
+            for row in retry:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    stats["retry_rows"] = len(retry)
+    return stats
+
+
+def simulate_results(batch_dir: str, error_rate: float = 0.0, seed: int = 0) -> list:
+    """
+    Provider-format result files (results_NNN.jsonl) for every exported request, with synthetic judgments and a
+    share of failed requests. Lets ingest and the retry flow be exercised without submitting anything.
+    """
+    from tools.offline_chat import synthetic_output
+
+    with open(os.path.join(batch_dir, "batch.json"), "r") as f:
+        meta = json.load(f)
+    metrics = {}
+    with open(os.path.join(batch_dir, "ids.jsonl"), "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                metrics[entry["custom_id"]] = entry["metrics"]
+    rng = random.Random(seed)
+    paths = []
+    for chunk in meta["chunks"]:
+        paths.append(os.path.join(batch_dir, chunk.replace("requests_", "results_")))
+        with open(os.path.join(batch_dir, chunk), "r") as requests, open(paths[-1], "w") as out:
+            for line in requests:
+                custom_id = json.loads(line)["custom_id"]
+                schema = output_schema(tuple(metrics[custom_id]))
+                failed = rng.random() < error_rate
+                output = None if failed else synthetic_output(schema, random.Random(f"{seed}:{custom_id}")).model_dump()
+                if meta["provider"] == "anthropic":
+                    result = {"type": "errored", "error": {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}} if failed else {
+                        "type": "succeeded",
+                        "message": {"role": "assistant", "model": meta["model"], "stop_reason": "tool_use",
+                                    "content": [{"type": "tool_use", "id": f"toolu_{custom_id}", "name": schema.__name__, "input": output}]},
+                    }
+                    line = {"custom_id": custom_id, "result": result}
+                else:
+                    body = {"error": {"message": "The server had an error processing your request", "type": "server_error"}} if failed else {
+                        "model": meta["model"],
+                        "choices": [{"index": 0, "finish_reason": "tool_calls", "message": {"role": "assistant", "content": None, "tool_calls": [
+                            {"id": f"call_{custom_id}", "type": "function", "function": {"name": schema.__name__, "arguments": json.dumps(output)}}]}}],
+                    }
+                    line = {"id": f"batch_req_{custom_id}", "custom_id": custom_id, "response": {"status_code": 500 if failed else 200, "body": body}, "error": None}
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export eval manifests as provider batch requests and ingest the batch results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write batch request files for a manifest")
+    export.add_argument("--manifest", type=str, required=True, help="JSONL of {image_file, logo_file, banner_request, metric} rows")
+    export.add_argument("--output_dir", type=str, required=True, help="Directory for batch.json, ids.jsonl and requests_NNN.jsonl")
+    export.add_argument("--evaluator", type=str, help=" or ".join(BATCH_MODELS), default="gpt4o")
+    export.add_argument("--metric", type=str, help="Metric(s) for rows without one, a comma separated list or all", default="CPYQ")
+    export.add_argument("--multi_metric", action="store_true", help="Judge all metrics of a banner in one request")
+    export.add_argument("--image_max_edge", type=str, help="Downscale images so their longest edge is at most this many pixels, or 'auto' for the evaluator's limit")
+    export.add_argument("--image_format", type=str, choices=list(IMAGE_FORMATS), help="Re-encode images in this format before sending them")
+    export.add_argument("--image_quality", type=int, help="Quality for webp/jpeg re-encoding", default=85)
+    export.add_argument("--max_requests", type=int, help="Requests per file, defaults to the provider limit")
+    export.add_argument("--max_mb", type=float, help="MB per file, defaults to the provider limit")
+    export.add_argument("--platform", type=str, choices=list(BATCH_URLS), default="azure", help="Endpoint of --evaluator gpt4o requests: Azure OpenAI or OpenAI")
+
+    ingest = commands.add_parser("ingest", help="Validate batch result files into eval result rows")
+    ingest.add_argument("results", type=str, nargs="+", help="Batch output (and error) files downloaded from the provider")
+    ingest.add_argument("--batch_dir", type=str, required=True, help="Directory written by export")
+    ingest.add_argument("--output", type=str, help="JSONL file for the result rows", default="eval_results.jsonl")
+    ingest.add_argument("--retry_manifest", type=str, help="JSONL file for the manifest rows of failed requests")
+
+    simulate = commands.add_parser("simulate", help="Write synthetic provider results for an exported batch")
+    simulate.add_argument("--batch_dir", type=str, required=True)
+    simulate.add_argument("--error_rate", type=float, default=0.0)
+    simulate.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        max_edge = args.image_max_edge
+        if max_edge is not None and max_edge != "auto":
+            max_edge = int(max_edge)
+        image_options = {"max_edge": max_edge, "image_format": args.image_format, "quality": args.image_quality}
+        stats = export_batch(args.manifest, args.output_dir, args.evaluator, args.metric, args.multi_metric,
+                             image_options, args.max_requests, args.max_mb, args.platform)
+    elif args.command == "ingest":
+        stats = ingest_batch(args.batch_dir, args.results, args.output, args.retry_manifest)
+    else:
+        stats = {"results": simulate_results(args.batch_dir, args.error_rate, args.seed)}
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,183 @@
+import argparse
+import json
+import math
+import os
+import re
+from functools import lru_cache
+
+DEMONSTRATIONS_PATH = ".layout_demonstrations.json"
+
+# Layout patterns of prompts/foreground_designer_prompt.py, with the words that identify them
+LAYOUT_PATTERNS = {
+    "left-content": ["left-content", "left content", "left_content", "left aligned", "left-aligned"],
+    "right-content": ["right-content", "right content", "right_content", "right aligned", "right-aligned"],
+    "z-pattern": ["z-pattern", "z pattern", "z_pattern"],
+    "f-pattern": ["f-pattern", "f pattern", "f_pattern"],
+    "centered": ["centered", "centred", "center"],
+    "circular": ["circular", "radial"],
+    "golden-ratio": ["golden"],
+    "rule-of-thirds": ["thirds"],
+    "diagonal": ["diagonal"],
+    "asymmetrical": ["asymmetric"],
+    "top-down": ["top-down", "top down", "top_down", "hierarchical"],
+    "pyramid": ["pyramid"],
+    "grid": ["grid", "modular"],
+}
+
+# Keys of a demonstration whose text describes its layout, searched for pattern words when it names no pattern
+DESCRIPTION_KEYS = ("layout", "pattern", "composition", "description")
+
+# Typography tiers of the foreground designer prompt
+SIZE_CLASS_EXAMPLES = {
+    "small": [(160, 600), (300, 250)],
+    "medium": [(728, 90), (468, 60)],
+    "large": [(1200, 628), (970, 250)],
+}
+
+
+def size_class(width: float, height: float) -> str:
+    """
+    Typography tier of a banner size: the tier of the closest example size in log aspect ratio and log area
+    """
+    def distance(example):
+        w, h = example
+        return math.hypot(math.log((width / height) / (w / h)), 0.5 * math.log((width * height) / (w * h)))
+
+    return min(SIZE_CLASS_EXAMPLES, key=lambda tier: min(distance(example) for example in SIZE_CLASS_EXAMPLES[tier]))
+
+
+def match_pattern(text: str):
+    text = text.lower()
+    for pattern, words in LAYOUT_PATTERNS.items():
+        if any(word in text for word in words):
+            return pattern
+    return None
+
+
+def _find_size(demonstration):
+    if isinstance(demonstration, dict):
+        for width_key, height_key in (("background_width", "background_height"), ("width", "height"), ("banner_width", "banner_height")):
+            if width_key in demonstration and height_key in demonstration:
+                try:
+                    return float(demonstration[width_key]), float(demonstration[height_key])
+                except (TypeError, ValueError):
+                    pass
+    match = re.search(r"(\d{2,4})\s*[xX×]\s*(\d{2,4})", json.dumps(demonstration, ensure_ascii=False))
+    return (float(match.group(1)), float(match.group(2))) if match else None
+
+
+def _description_values(value, key: str = ""):
+    """
+    Strings under layout, pattern, composition or description keys at any depth, not element properties such as
+    alignment that would match a pattern word like "center"
+    """
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            yield from _description_values(child, str(child_key).lower())
+    elif isinstance(value, list):
+        for child in value:
+            yield from _description_values(child, key)
+    elif isinstance(value, str) and any(word in key for word in DESCRIPTION_KEYS):
+        yield value
+
+
+def _describe(name, demonstration):
+    """
+    Pattern and size of one demonstration, read from its name, explicit fields or text
+    """
+    pattern = None
+    if isinstance(demonstration, dict):
+        for key in ("layout_pattern", "pattern", "layout_style", "layout", "style"):
+            if isinstance(demonstration.get(key), str):
+                pattern = match_pattern(demonstration[key])
+                if pattern:
+                    break
+    pattern = pattern or match_pattern(name or "") or match_pattern(" ".join(_description_values(demonstration)))
+    size = _find_size(demonstration)
+    return {
+        "name": name,
+        "pattern": pattern,
+        "size": size,
+        "aspect_ratio": size[0] / size[1] if size else None,
+        "size_class": size_class(*size) if size else None,
+        "demonstration": demonstration,
+    }
+
+
+@lru_cache(maxsize=4)
+def _load_index(path: str, mtime_ns: int):
+    with open(path, "r") as f:
+        demonstrations = json.load(f)
+    items = demonstrations.items() if isinstance(demonstrations, dict) else ((None, item) for item in demonstrations)
+    return tuple(_describe(name, demonstration) for name, demonstration in items)
+
+
+def load_index(path: str = DEMONSTRATIONS_PATH):
+    """
+    Entries of the demonstration file with their pattern, size, aspect ratio and size class, reloaded when the file changes
+    """
+    return _load_index(path, os.stat(path).st_mtime_ns)
+
+
+def select_demonstrations(width: float, height: float, pattern: str = None, k: int = 3, path: str = DEMONSTRATIONS_PATH) -> list:
+    """
+    The k demonstrations most relevant to a banner size and, optionally, a layout pattern.
+    Without a pattern, the top candidates are taken from distinct patterns so the designer still sees variety.
+    """
+    index = load_index(path)
+    pattern = match_pattern(pattern) if pattern else None
+    target_class, target_aspect = size_class(width, height), width / height
+
+    def relevance(entry):
+        score = 0.0
+        if pattern and entry["pattern"] == pattern:
+            score += 4
+        if entry["size"] == (float(width), float(height)):
+            score += 2
+        if entry["size_class"] == target_class:
+            score += 1
+        if entry["aspect_ratio"]:
+            score -= abs(math.log(entry["aspect_ratio"] / target_aspect))
+        return score
+
+    ranked = sorted(index, key=relevance, reverse=True)
+    if pattern:
+        return ranked[:k]
+    selected, seen = [], set()
+    for entry in ranked:
+        if entry["pattern"] not in seen:
+            selected.append(entry)
+            seen.add(entry["pattern"])
+        if len(selected) == k:
+            return selected
+    return selected + [entry for entry in ranked if entry not in selected][:k - len(selected)]
+
+
+def serialize_demonstrations(entries: list) -> str:
+    """
+    Compact JSON of the selected demonstrations, keyed by their original names where they had one
+    """
+    if all(entry["name"] is not None for entry in entries):
+        payload = {entry["name"]: entry["demonstration"] for entry in entries}
+    else:
+        payload = [entry["demonstration"] for entry in entries]
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    from prompts.foreground_designer_prompt import build_foreground_designer_system_prompt
+    from tools.tracing import count_tokens
+
+    parser = argparse.ArgumentParser(description="Compare the foreground designer prompt with all demonstrations against retrieved ones")
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--height", type=int, default=250)
+    parser.add_argument("--pattern", type=str)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--path", type=str, default=DEMONSTRATIONS_PATH)
+    args = parser.parse_args()
+
+    full = count_tokens(build_foreground_designer_system_prompt(k=None, path=args.path))
+    selected = count_tokens(build_foreground_designer_system_prompt(args.width, args.height, args.pattern, args.k, args.path))
+    for entry in select_demonstrations(args.width, args.height, args.pattern, args.k, args.path):
+        print(f"selected: {entry['name']} ({entry['pattern']}, {entry['size']})")
+    print(f"prompt tokens: {full} with every demonstration, {selected} with top-{args.k} ({1 - selected / full:.0%} smaller)")
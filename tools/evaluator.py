@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import time
+
+from prompts.eval_prompt import parse_metrics, build_system_prompt, build_multi_metric_prompt
+from tools.tool_utils import prepare_image_message, image_cache_stats, BOutput, multi_output_model, PROVIDER_MAX_EDGE
+from tools.judgment_cache import file_digest, judgment_key
+from tools.tracing import ainvoke, span
+
+
+def _scheduled() -> bool:
+    # Under the rate limiter, it owns retries within the shared budget and reads the response headers
+    from tools.rate_limiter import get_scheduler
+    return get_scheduler() is not None
+
+
+def _azure_gpt4o():
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),  # or your deployment
+        api_version="2024-10-21",  # or your api version #  os.getenv("AZURE_OPENAI_VERSION")
+        temperature=0.3,
+        max_tokens=2000,
+        max_retries=0 if _scheduled() else 2,
+        include_response_headers=_scheduled(),
+    )
+
+def _claude():
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(
+        model="claude-3-5-sonnet-20241022",  # or another Claude model version
+        anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+        temperature=0.3,
+        max_tokens=200,  # or specify a limit
+        max_retries=0 if _scheduled() else 2
+    )
+
+def _offline(mode):
+    def factory():
+        from tools.offline_chat import from_env
+        return from_env(mode)
+    return factory
+
+# Chat model factories by --evaluator name. Provider SDKs are only imported when their factory runs.
+CHAT_MODELS = {
+    "gpt4o": _azure_gpt4o,
+    "claude": _claude,
+    # Offline stand-ins for benchmarks and regression runs, see tools/offline_chat.py
+    "synthetic": _offline("synthetic"),
+    "replay": _offline("replay"),
+    "record": _offline("record"),
+}
+
+
+def make_chat_model(evaluator: str):
+    if evaluator not in CHAT_MODELS:
+        raise ValueError(f"Unknown evaluator {evaluator}, choose from {', '.join(CHAT_MODELS)}")
+    from dotenv import load_dotenv
+    load_dotenv()
+    return CHAT_MODELS[evaluator]()
+
+
+def evaluator_name(chat_model) -> str:
+    if getattr(chat_model, "mode", None) == "record":
+        # Offline record mode: name the wrapped provider model it calls
+        chat_model = chat_model.chat_model
+    model = getattr(chat_model, "deployment_name", None) or getattr(chat_model, "model", None) or getattr(chat_model, "model_name", None)
+    return f"{type(chat_model).__name__}/{model}"
+
+
+def build_messages(system_prompt, image_data, logo_data, banner_request):
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    return [
+        SystemMessage(content=system_prompt),
+    HumanMessage(content=[
+        {
+            "type": "text",
+            "text": "The banner image to be evaluated is:"
+        },
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": image_data
+            }
+        },
+        {
+            "type": "text",
+            "text": "For your reference, the advertiser logo is:"
+        },
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": logo_data
+            }
+        },
+        {
+            "type": "text",
+            "text": f"For your reference, the advertiser banner request is: {banner_request}"
+        }
+        ])
+    ]
+
+
+async def score_banner(chat_model, image_data, logo_data, banner_request, metrics, multi_metric=False):
+    """
+    Score one banner on the given metrics, returning {metric: {"score", "explanation"}}.
+    With multi_metric all metrics are judged from a single message, otherwise one call is made per metric.
+    """
+    metrics = list(dict.fromkeys(metrics))
+    model = evaluator_name(chat_model)
+    if multi_metric:
+        messages = build_messages(build_multi_metric_prompt(metrics), image_data, logo_data, banner_request)
+        response = await ainvoke(chat_model.with_structured_output(multi_output_model(metrics)), messages, "eval", ",".join(metrics), model)
+        return response.scores()
+    structured_llm = chat_model.with_structured_output(BOutput)
+    responses = await asyncio.gather(*[
+        ainvoke(structured_llm, build_messages(build_system_prompt(metric), image_data, logo_data, banner_request), "eval", metric, model)
+        for metric in metrics
+    ])
+    return {metric: response.model_dump() for metric, response in zip(metrics, responses)}
+
+
+def agreement(scores, reference_scores):
+    """
+    Compare multi-metric scores with the per-metric scores of the same banners
+    """
+    diffs = [score - reference for score, reference in zip(scores, reference_scores)]
+    if not diffs:
+        return {}
+    return {
+        "compared": len(diffs),
+        "exact_agreement": round(sum(diff == 0 for diff in diffs) / len(diffs), 3),
+        "within_one": round(sum(abs(diff) <= 1 for diff in diffs) / len(diffs), 3),
+        "mean_abs_diff": round(sum(abs(diff) for diff in diffs) / len(diffs), 3),
+        "mean_diff": round(sum(diffs) / len(diffs), 3),
+    }
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def load_manifest(manifest_path, default_metric="CPYQ"):
+    """
+    Read manifest rows, expanding rows without a metric into one row per default metric
+    """
+    rows = []
+    with open(manifest_path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for metric in parse_metrics(row.get("metric", default_metric)):
+                rows.append({**row, "metric": metric})
+    return rows
+
+
+class Evaluator:
+    """
+    Scores banner ads on the rubric metrics in SCORE_PRINCIPLES.
+    The chat model is only built (and its provider SDK imported) on first use, unless one is passed in.
+    """
+
+    def __init__(self, evaluator: str = "gpt4o", chat_model=None, cache=None, image_options: dict = None):
+        self.evaluator = evaluator
+        self.cache = cache
+        self.image_options = dict(image_options or {})
+        if self.image_options.get("max_edge") == "auto":
+            self.image_options["max_edge"] = PROVIDER_MAX_EDGE.get(evaluator)
+        self._chat_model = chat_model
+        # LLM calls made by judge(): one per multi-metric judgment, one per metric otherwise
+        self.llm_calls = 0
+
+    @property
+    def chat_model(self):
+        if self._chat_model is None:
+            self._chat_model = make_chat_model(self.evaluator)
+        return self._chat_model
+
+    @property
+    def name(self) -> str:
+        name = evaluator_name(self.chat_model)
+        if self.image_options.get("max_edge") is not None or self.image_options.get("image_format") is not None:
+            # The model sees the preprocessed images, so their settings are part of the judgment
+            name += "|{max_edge}|{image_format}|{quality}".format(**{"max_edge": None, "image_format": None, "quality": 85, **self.image_options})
+        return name
+
+    async def judge(self, image_path, logo_path, banner_request, metrics, multi_metric=False):
+        """
+        Score one banner from its files, serving judgments from the cache where possible.
+        Returns ({metric: {"score", "explanation"}}, number of metrics served from the cache).
+        """
+        metrics = list(dict.fromkeys(metrics))
+        scores, keys = {}, {}
+        if self.cache is not None:
+            banner_hash, logo_hash = await asyncio.gather(
+                asyncio.to_thread(file_digest, image_path),
+                asyncio.to_thread(file_digest, logo_path),
+            )
+            name = self.name
+            # Multi-metric judgments depend on every metric sharing the prompt, so they are keyed on the full prompt
+            multi_prompt = build_multi_metric_prompt(metrics) if multi_metric else None
+            for metric in metrics:
+                keys[metric] = judgment_key(banner_hash, logo_hash, banner_request, metric, name, multi_prompt or build_system_prompt(metric))
+                hit = self.cache.get(keys[metric])
+                if hit is not None:
+                    scores[metric] = hit
+        cached = len(scores)
+        missing = [metric for metric in metrics if metric not in scores]
+        if missing:
+            if multi_metric:
+                missing = metrics
+            with span("eval", name="prepare_image_message", metric=",".join(missing)) as record:
+                image_data, logo_data = await asyncio.gather(
+                    asyncio.to_thread(prepare_image_message, image_path, **self.image_options),
+                    asyncio.to_thread(prepare_image_message, logo_path, **self.image_options),
+                )
+                record["payload_bytes"] = len(image_data) + len(logo_data)
+            self.llm_calls += 1 if multi_metric else len(missing)
+            fresh = await score_banner(self.chat_model, image_data, logo_data, banner_request, missing, multi_metric)
+            for metric, value in fresh.items():
+                scores[metric] = value
+                if self.cache is not None:
+                    self.cache.put(keys[metric], value, metric, name)
+        return scores, cached
+
+    def score(self, image_path, logo_path, banner_request, metrics="CPYQ", multi_metric=False) -> dict:
+        """
+        Synchronously score one banner, returning {metric: {"score", "explanation"}}
+        """
+        if isinstance(metrics, str):
+            metrics = parse_metrics(metrics)
+        scores, _ = asyncio.run(self.judge(image_path, logo_path, banner_request, metrics, multi_metric))
+        return scores
+
+    async def evaluate_group(self, rows, semaphore, multi_metric=False, check_agreement=False):
+        """
+        Score manifest rows that share one banner, returning each row together with its score or error
+        """
+        results = [{**row, "evaluator": self.evaluator} for row in rows]
+        first = rows[0]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                for path in (first["image_file"], first["logo_file"]):
+                    if not os.path.isfile(path):
+                        raise FileNotFoundError(path)
+                metrics = [row["metric"] for row in rows]
+                scores, cached = await self.judge(first["image_file"], first["logo_file"], first["banner_request"], metrics, multi_metric)
+                reference = None
+                if check_agreement:
+                    reference, _ = await self.judge(first["image_file"], first["logo_file"], first["banner_request"], metrics)
+                for result in results:
+                    result.update(scores[result["metric"]])
+                    result["cached"] = cached == len(set(metrics))
+                    if reference is not None:
+                        result["reference_score"] = reference[result["metric"]]["score"]
+            except Exception as e:
+                for result in results:
+                    result["error"] = f"{type(e).__name__}: {e}"
+            latency = time.perf_counter() - start
+        for result in results:
+            result["latency"] = latency
+        return results
+
+    async def run_batch(self, manifest_path, output_path, concurrency=8, multi_metric=False, check_agreement=False, default_metric="CPYQ"):
+        """
+        Score every row of a manifest with at most `concurrency` requests in flight.
+        Results are appended to output_path as soon as each one finishes.
+        With multi_metric, rows for the same banner are grouped and judged in one call.
+        Judgments already in the cache are not sent again, so re-running an interrupted batch resumes it.
+        """
+        rows = load_manifest(manifest_path, default_metric)
+        multi_metric = multi_metric or check_agreement
+        groups = {}
+        for i, row in enumerate(rows):
+            key = (row.get("image_file"), row.get("logo_file"), row.get("banner_request")) if multi_metric else i
+            groups.setdefault(key, []).append(row)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        latencies, errors, scores, reference_scores = [], 0, [], []
+        calls = self.llm_calls
+        start = time.perf_counter()
+        with open(output_path, "w") as out:
+            tasks = [self.evaluate_group(group, semaphore, multi_metric, check_agreement) for group in groups.values()]
+            for done in asyncio.as_completed(tasks):
+                results = await done
+                latencies.append(results[0]["latency"])
+                for result in results:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    if "error" in result:
+                        errors += 1
+                        print(f"error: {result.get('image_file')} ({result['metric']}): {result['error']}")
+                    elif "reference_score" in result:
+                        scores.append(result["score"])
+                        reference_scores.append(result["reference_score"])
+                out.flush()
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            "rows": len(rows),
+            "groups": len(groups),
+            "llm_requests": self.llm_calls - calls,
+            "errors": errors,
+            "concurrency": concurrency,
+            "wall_time_s": round(elapsed, 3),
+            "throughput_rows_per_s": round(len(rows) / elapsed, 3) if elapsed else 0.0,
+            "latency_p50_s": round(_percentile(latencies, 50), 3),
+            "latency_p95_s": round(_percentile(latencies, 95), 3),
+            "latency_max_s": round(max(latencies, default=0.0), 3),
+        }
+        if check_agreement:
+            stats["agreement"] = agreement(scores, reference_scores)
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        stats["images"] = image_cache_stats()
+        return stats
@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tools.tool_utils import file_digest
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "judgments.sqlite3")
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def judgment_key(banner_hash: str, logo_hash: str, banner_request: str, metric: str, evaluator: str, system_prompt: str) -> str:
+    """
+    Content address of one judgment. Any change to the banner, logo, request, metric,
+    evaluator model or rendered system prompt gives a different key.
+    """
+    payload = json.dumps(
+        [banner_hash, logo_hash, banner_request, metric, evaluator, text_digest(system_prompt)],
+        ensure_ascii=False,
+    )
+    return text_digest(payload)
+
+
+class JudgmentCache:
+    """Persistent SQLite store of {"score", "explanation"} judgments keyed by judgment_key"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS judgments (
+                key TEXT PRIMARY KEY,
+                metric TEXT NOT NULL,
+                evaluator TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS judgments_accessed ON judgments (accessed_at)")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM judgments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE judgments SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict, metric: str, evaluator: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judgments (key, metric, evaluator, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, metric, evaluator, json.dumps(value, ensure_ascii=False), now, now),
+            )
+
+    def prune(self, max_age_days: float = None, max_mb: float = None) -> int:
+        """
+        Drop entries created more than max_age_days ago, then the least recently used
+        entries until the stored judgments take at most max_mb. Returns the number removed.
+        """
+        removed = 0
+        with self._lock:
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                removed += self._conn.execute("DELETE FROM judgments WHERE created_at < ?", (cutoff,)).rowcount
+            if max_mb is not None:
+                budget = max_mb * 1024 * 1024
+                total = 0
+                rows = self._conn.execute(
+                    "SELECT key, length(key) + length(value) FROM judgments ORDER BY accessed_at DESC"
+                ).fetchall()
+                stale = []
+                for key, size in rows:
+                    total += size
+                    if total > budget:
+                        stale.append((key,))
+                self._conn.executemany("DELETE FROM judgments WHERE key = ?", stale)
+                removed += len(stale)
+            if removed:
+                self._conn.execute("VACUUM")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT count(*), coalesce(sum(length(key) + length(value)), 0) FROM judgments"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "stored_mb": round(size / 1024 / 1024, 3),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or prune the eval judgment cache")
+    parser.add_argument("--cache_path", type=str, default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--max_age_days", type=float, help="Remove judgments older than this")
+    parser.add_argument("--max_mb", type=float, help="Keep at most this many MB of judgments, least recently used first out")
+    args = parser.parse_args()
+
+    cache = JudgmentCache(args.cache_path)
+    if args.max_age_days is not None or args.max_mb is not None:
+        print(f"Removed {cache.prune(args.max_age_days, args.max_mb)} judgments")
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
@@ -0,0 +1,143 @@
+import argparse
+import json
+
+import numpy as np
+
+from tools.pillow_renderer import iter_elements, measure_element, parse_number
+
+# Rules from prompts/foreground_designer_prompt.py
+MIN_EDGE_MARGIN = 10
+LOGO_CLEAR_SPACE = 16
+MAX_LOGO_RATIO = 0.25
+UTILIZATION_RANGE = (0.7, 0.9)
+
+
+def _label(kind, spec, i):
+    text = str(spec.get("text", "")).strip()
+    return f"{kind} {i}" + (f' "{text[:30]}"' if text else "")
+
+
+def layout_boxes(layout: dict, logo_size: tuple = None):
+    """
+    Element labels, kinds and an (N, 4) array of [x0, y0, x1, y1] boxes as rendered by tools.pillow_renderer
+    """
+    labels, kinds, boxes = [], [], []
+    for i, (kind, spec) in enumerate(iter_elements(layout)):
+        x, y, width, height = measure_element(kind, spec, logo_size)
+        labels.append(_label(kind, spec, i))
+        kinds.append(kind)
+        boxes.append((x, y, x + width, y + height))
+    return labels, np.array(kinds), np.array(boxes, dtype=float).reshape(-1, 4)
+
+
+def validate_layout(layout: dict, width: int = None, height: int = None, logo_size: tuple = None,
+                    min_margin: float = MIN_EDGE_MARGIN, logo_clear_space: float = LOGO_CLEAR_SPACE,
+                    max_logo_ratio: float = MAX_LOGO_RATIO, utilization_range: tuple = UTILIZATION_RANGE) -> dict:
+    """
+    Check a foreground layout for geometry problems that do not need a vision model to spot:
+    elements outside the frame, overlapping elements, edge margins, logo size and clear space, and spatial utilization.
+    Returns {"ok", "findings", "utilization", "coverage"}; "ok" is False when any finding has severity "error".
+    """
+    width = float(width or parse_number(layout.get("background_width")))
+    height = float(height or parse_number(layout.get("background_height")))
+    if not width or not height:
+        raise ValueError("The layout needs background_width and background_height")
+    labels, kinds, boxes = layout_boxes(layout, logo_size)
+    findings = []
+    if not len(boxes):
+        return {"ok": True, "findings": findings, "utilization": 0.0, "coverage": 0.0}
+    x0, y0, x1, y1 = boxes.T
+
+    # Frame violations and edge margins, per element and side
+    frame = np.array([width, height, width, height])
+    overflow = np.stack([-x0, -y0, x1 - width, y1 - height], axis=1)
+    sides = np.array(["left", "top", "right", "bottom"])
+    for i, j in zip(*np.nonzero(overflow > 0)):
+        findings.append({
+            "rule": "out_of_frame", "severity": "error", "elements": [labels[i]],
+            "message": f"{labels[i]} extends {overflow[i, j]:.0f}px past the {sides[j]} edge of the {width:.0f}x{height:.0f} frame",
+        })
+    tight = (overflow <= 0) & (overflow > -min_margin)
+    for i, j in zip(*np.nonzero(tight)):
+        findings.append({
+            "rule": "edge_margin", "severity": "warning", "elements": [labels[i]],
+            "message": f"{labels[i]} is {-overflow[i, j]:.0f}px from the {sides[j]} edge, keep at least {min_margin:.0f}px",
+        })
+
+    # Pairwise overlaps and gaps in one pass
+    overlap_w = np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :])
+    overlap_h = np.minimum(y1[:, None], y1[None, :]) - np.maximum(y0[:, None], y0[None, :])
+    overlap = np.clip(overlap_w, 0, None) * np.clip(overlap_h, 0, None)
+    gap = np.maximum(-overlap_w, -overlap_h)
+    upper = np.triu(np.ones_like(overlap, dtype=bool), k=1)
+    for i, j in zip(*np.nonzero((overlap > 0) & upper)):
+        findings.append({
+            "rule": "overlap", "severity": "error", "elements": [labels[i], labels[j]],
+            "message": f"{labels[i]} and {labels[j]} overlap by {overlap_w[i, j]:.0f}x{overlap_h[i, j]:.0f}px",
+        })
+
+    # Logo size and clear space
+    smallest = min(width, height)
+    for i in np.nonzero(kinds == "logo")[0]:
+        logo_w, logo_h = x1[i] - x0[i], y1[i] - y0[i]
+        # The rule caps the logo's short side, a wide logo can still span 15-20% of a large banner's width
+        if min(logo_w, logo_h) > max_logo_ratio * smallest:
+            findings.append({
+                "rule": "logo_size", "severity": "warning", "elements": [labels[i]],
+                "message": f"{labels[i]} is {logo_w:.0f}x{logo_h:.0f}px, more than {max_logo_ratio:.0%} of the smallest banner dimension ({smallest:.0f}px)",
+            })
+        crowded = (gap[i] < logo_clear_space) & (overlap[i] == 0)
+        crowded[i] = False
+        for j in np.nonzero(crowded)[0]:
+            findings.append({
+                "rule": "logo_clear_space", "severity": "warning", "elements": [labels[i], labels[j]],
+                "message": f"{labels[j]} is {max(gap[i, j], 0):.0f}px from the logo, keep at least {logo_clear_space:.0f}px clear space",
+            })
+
+    # Spatial utilization: the share of the frame spanned by the elements, and the share actually covered
+    clipped = np.clip(boxes, 0, frame)
+    spread = (clipped[:, 2].max() - clipped[:, 0].min()) * (clipped[:, 3].max() - clipped[:, 1].min()) / (width * height)
+    mask = np.zeros((int(np.ceil(height)), int(np.ceil(width))), dtype=bool)
+    for bx0, by0, bx1, by1 in np.round(clipped).astype(int):
+        mask[by0:by1, bx0:bx1] = True
+    coverage = mask.mean()
+    if not utilization_range[0] <= spread <= utilization_range[1]:
+        findings.append({
+            "rule": "utilization", "severity": "warning", "elements": [],
+            "message": f"Elements span {spread:.0%} of the canvas, aim for {utilization_range[0]:.0%}-{utilization_range[1]:.0%}",
+        })
+
+    return {
+        "ok": not any(finding["severity"] == "error" for finding in findings),
+        "findings": findings,
+        "utilization": round(float(spread), 3),
+        "coverage": round(float(coverage), 3),
+    }
+
+
+def format_findings(result: dict) -> str:
+    """
+    Findings as FEEDBACK lines for the design reviewer or refinement prompt
+    """
+    if not result["findings"]:
+        return "No geometric issues found."
+    return "\n".join(f"- [{finding['severity']}] {finding['message']}" for finding in result["findings"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a foreground layout for geometric rule violations")
+    parser.add_argument("layout", type=str, help="Path to the layout JSON")
+    parser.add_argument("--logo_image", type=str, help="Logo image, used for its aspect ratio")
+    parser.add_argument("--json", action="store_true", help="Print the findings as JSON")
+    args = parser.parse_args()
+
+    with open(args.layout, "r") as f:
+        layout = json.load(f)
+    logo_size = None
+    if args.logo_image:
+        from PIL import Image
+        with Image.open(args.logo_image) as logo:
+            logo_size = logo.size
+    result = validate_layout(layout, logo_size=logo_size)
+    print(json.dumps(result, indent=2) if args.json else format_findings(result))
+    exit(0 if result["ok"] else 1)
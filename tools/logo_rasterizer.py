@@ -0,0 +1,197 @@
+"""
+Render the BannerRequest400 SVG logos at the exact pixel size a layout asks for, instead of rescaling the
+pre-rendered logos_png bitmaps. Results are cached under .cache/logos, keyed by the SVG's content hash,
+the output size and the crop mode, so each logo/size pair is rasterized once.
+
+SVG rendering needs cairosvg (in requirements.txt) and the system cairo library, e.g. apt install libcairo2 or
+brew install cairo.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from PIL import Image
+
+from tools.layout_validator import MAX_LOGO_RATIO
+from tools.request_dataset import BANNER_SIZES, DATASET_DIR
+from tools.tool_utils import file_digest
+
+RASTER_CACHE_DIR = os.path.join(".cache", "logos")
+# "content" trims the transparent margin around the artwork, "none" keeps the whole SVG canvas
+CROP_MODES = ("content", "none")
+# Longest edge of the render used to find the artwork's bounds
+PROBE_EDGE = 1024
+# Share of the banner width a logo may take, from prompts/foreground_designer_prompt.py
+MAX_LOGO_WIDTH_RATIO = 0.2
+# Bump when the rendering changes, so old cache entries are not reused
+RASTER_VERSION = 1
+
+
+def _svg_to_image(data: bytes, width: int = None, height: int = None):
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        # cairocffi raises OSError when the cairo library itself is missing
+        raise ImportError("Rasterizing SVG logos needs cairosvg and the cairo library: pip install cairosvg") from e
+    png = cairosvg.svg2png(bytestring=data, output_width=width, output_height=height)
+    return Image.open(io.BytesIO(png)).convert("RGBA")
+
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=1024)
+def _svg_geometry(digest: str, svg_path: str, cache_dir: str):
+    """
+    Intrinsic (width, height) of an SVG and its artwork bounds as fractions (left, top, right, bottom) of the canvas
+    """
+    geometry_path = os.path.join(cache_dir, f"{digest}.json")
+    if os.path.exists(geometry_path):
+        with open(geometry_path, "r") as f:
+            geometry = json.load(f)
+        return tuple(geometry["size"]), tuple(geometry["bounds"])
+    with open(svg_path, "rb") as f:
+        data = f.read()
+    width, height = _svg_to_image(data).size
+    scale = PROBE_EDGE / max(width, height)
+    probe = _svg_to_image(data, round(width * scale), round(height * scale))
+    bbox = probe.getchannel("A").getbbox() or (0, 0, probe.width, probe.height)
+    bounds = (bbox[0] / probe.width, bbox[1] / probe.height, bbox[2] / probe.width, bbox[3] / probe.height)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_atomic(geometry_path, lambda f: f.write(json.dumps({"size": [width, height], "bounds": bounds}).encode("utf-8")))
+    return (width, height), bounds
+
+
+def logo_aspect(svg_path: str, crop: str = "content", cache_dir: str = RASTER_CACHE_DIR) -> float:
+    """
+    Width / height of the logo as it is rasterized with this crop mode
+    """
+    (width, height), (left, top, right, bottom) = _svg_geometry(file_digest(svg_path), svg_path, cache_dir)
+    if crop == "none":
+        return width / height
+    return (right - left) * width / ((bottom - top) * height)
+
+
+def banner_logo_size(banner_width: int, banner_height: int, aspect: float):
+    """
+    Largest logo size the designer rules allow in a banner: at most 20% of the banner width,
+    and a short side of at most 25% of the smallest banner dimension
+    """
+    max_short_side = MAX_LOGO_RATIO * min(banner_width, banner_height)
+    width = min(MAX_LOGO_WIDTH_RATIO * banner_width, max_short_side * max(aspect, 1.0))
+    height = width / aspect
+    if min(width, height) > max_short_side:
+        height = max_short_side
+        width = height * aspect
+    return max(1, round(width)), max(1, round(height))
+
+
+def rasterize_logo(svg_path: str, width: int = None, height: int = None, crop: str = "content",
+                   banner_size: tuple = None, cache_dir: str = RASTER_CACHE_DIR) -> str:
+    """
+    Path of a png of the SVG at width x height, rendering it only on a cache miss.
+    Missing sides follow the logo's aspect ratio; with banner_size instead of a size, the logo gets
+    the largest size allowed for that banner. A size with another aspect ratio is stretched, as render_layout does.
+    """
+    if crop not in CROP_MODES:
+        raise ValueError(f"Unknown crop mode {crop}, expected one of {CROP_MODES}")
+    digest = file_digest(svg_path)
+    (svg_width, svg_height), bounds = _svg_geometry(digest, svg_path, cache_dir)
+    left, top, right, bottom = bounds if crop == "content" else (0.0, 0.0, 1.0, 1.0)
+    content_width, content_height = (right - left) * svg_width, (bottom - top) * svg_height
+    aspect = content_width / content_height
+    if banner_size is not None and width is None and height is None:
+        width, height = banner_logo_size(*banner_size, aspect)
+    elif width is None and height is None:
+        width, height = content_width, content_height
+    elif width is None:
+        width = height * aspect
+    elif height is None:
+        height = width / aspect
+    width, height = max(1, round(width)), max(1, round(height))
+
+    key = hashlib.sha256(f"{RASTER_VERSION}:{digest}:{width}x{height}:{crop}".encode("utf-8")).hexdigest()
+    output_path = os.path.join(cache_dir, key[:2], f"{key}.png")
+    if os.path.exists(output_path):
+        return output_path
+
+    # Render the whole canvas so the artwork comes out at least at the target size, then cut the artwork out
+    scale = max(width / content_width, height / content_height)
+    full_width, full_height = max(1, round(svg_width * scale)), max(1, round(svg_height * scale))
+    with open(svg_path, "rb") as f:
+        image = _svg_to_image(f.read(), full_width, full_height)
+    image = image.crop((round(left * full_width), round(top * full_height), round(right * full_width), round(bottom * full_height)))
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.LANCZOS)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    _write_atomic(output_path, lambda f: image.save(f, format="PNG", optimize=True))
+    return output_path
+
+
+def _rasterize_job(job: dict) -> str:
+    return rasterize_logo(**job)
+
+
+def rasterize_many(jobs: list, max_workers: int = None) -> list:
+    """
+    Rasterize several logos in a process pool. Each job holds the keyword arguments of rasterize_logo.
+    Returns the png paths in job order.
+    """
+    if len(jobs) <= 1 or max_workers == 1:
+        return [_rasterize_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_rasterize_job, jobs, chunksize=max(1, len(jobs) // (4 * (max_workers or os.cpu_count() or 1)))))
+
+
+def _warmup_logo(job: tuple) -> list:
+    svg_path, sizes, crop, cache_dir = job
+    return [rasterize_logo(svg_path, crop=crop, banner_size=tuple(size), cache_dir=cache_dir) for size in sizes]
+
+
+def warmup(logo_dir: str = os.path.join(DATASET_DIR, "logos_svg"), sizes: list = BANNER_SIZES, crop: str = "content",
+           max_workers: int = None, cache_dir: str = RASTER_CACHE_DIR) -> dict:
+    """
+    Pre-render every logo in logo_dir at its largest allowed size in each banner size.
+    Each worker takes whole logos, so a logo's bounds are measured once.
+    """
+    logos = sorted(os.path.join(logo_dir, name) for name in os.listdir(logo_dir) if name.lower().endswith(".svg"))
+    jobs = [(path, sizes, crop, cache_dir) for path in logos]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        paths = [path for logo_paths in pool.map(_warmup_logo, jobs) for path in logo_paths]
+    return {"logos": len(logos), "sizes": len(sizes), "rasters": len(set(paths)), "seconds": round(time.perf_counter() - start, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rasterize SVG logos at banner sizes into the logo cache")
+    parser.add_argument("svg", type=str, nargs="*", help="SVG files to rasterize")
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--banner_size", type=str, help="Size the logo for a banner, e.g. 728x90")
+    parser.add_argument("--crop", type=str, choices=CROP_MODES, default="content")
+    parser.add_argument("--warmup", action="store_true", help="Pre-render every logo in --logo_dir for the 13 standard banner sizes")
+    parser.add_argument("--logo_dir", type=str, default=os.path.join(DATASET_DIR, "logos_svg"))
+    parser.add_argument("--max_workers", type=int)
+    parser.add_argument("--cache_dir", type=str, default=RASTER_CACHE_DIR)
+    args = parser.parse_args()
+
+    try:
+        if args.warmup:
+            print(json.dumps(warmup(args.logo_dir, crop=args.crop, max_workers=args.max_workers, cache_dir=args.cache_dir)))
+        banner_size = tuple(int(v) for v in args.banner_size.lower().split("x")) if args.banner_size else None
+        jobs = [{"svg_path": path, "width": args.width, "height": args.height, "crop": args.crop,
+                 "banner_size": banner_size, "cache_dir": args.cache_dir} for path in args.svg]
+        for path in rasterize_many(jobs, args.max_workers):
+            print(path)
+    except ImportError as e:
+        print(e)
+        exit(3)
@@ -0,0 +1,236 @@
+"""
+Offline stand-ins for the provider chat models, for benchmarks and regression runs without network or spend.
+
+    synthetic: returns schema-valid structured outputs (e.g. BOutput) drawn deterministically from the request,
+               after a simulated latency, failing at a configurable rate
+    replay:    serves responses recorded earlier, keyed by the request fingerprint
+    record:    calls a real chat model and appends its responses to the replay file
+
+Only with_structured_output(schema).invoke/ainvoke is supported, which is how the evaluator uses chat models.
+With --evaluator synthetic|replay|record, settings come from the environment (see .env.example).
+"""
+import asyncio
+import enum
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import types
+import typing
+from functools import lru_cache
+
+from pydantic import BaseModel
+
+DEFAULT_REPLAY_PATH = os.path.join(".cache", "replay.jsonl")
+
+
+class SyntheticAPIError(RuntimeError):
+    """Simulated provider failure, carrying the HTTP status a real client would have seen"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Synthetic API error {status_code}")
+        self.status_code = status_code
+
+
+class ReplayMissError(LookupError):
+    """No recorded response for a request fingerprint"""
+
+
+def _message_payload(message):
+    if isinstance(message, BaseModel) or hasattr(message, "content"):
+        return [getattr(message, "type", type(message).__name__), message.content]
+    if isinstance(message, tuple):
+        return list(message)
+    return message
+
+
+@lru_cache(maxsize=256)
+def _schema_json(schema) -> str:
+    return json.dumps(schema.model_json_schema(), sort_keys=True) if schema is not None else "null"
+
+
+def fingerprint(schema, messages) -> str:
+    """
+    Content address of a structured request: the schema's JSON schema and every message, images included
+    """
+    payload = _schema_json(schema) + json.dumps([_message_payload(m) for m in messages], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _bounds(metadata, default_low, default_high):
+    low, high = default_low, default_high
+    for constraint in metadata:
+        low = getattr(constraint, "ge", None) if getattr(constraint, "ge", None) is not None else low
+        high = getattr(constraint, "le", None) if getattr(constraint, "le", None) is not None else high
+        if getattr(constraint, "gt", None) is not None:
+            low = constraint.gt + 1
+        if getattr(constraint, "lt", None) is not None:
+            high = constraint.lt - 1
+    return low, high
+
+
+def _synthetic_value(annotation, metadata, rng, name):
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Literal:
+        return rng.choice(args)
+    if origin is typing.Union or origin is types.UnionType:
+        return _synthetic_value(next(arg for arg in args if arg is not type(None)), metadata, rng, name)
+    if origin is typing.Annotated:
+        return _synthetic_value(args[0], list(metadata) + list(annotation.__metadata__), rng, name)
+    if origin in (list, set, tuple):
+        return [_synthetic_value(args[0] if args else str, [], rng, name) for _ in range(rng.randint(1, 3))]
+    if origin is dict:
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return synthetic_output(annotation, rng)
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        return rng.choice(list(annotation))
+    if annotation is bool:
+        return rng.random() < 0.5
+    if annotation is int:
+        return rng.randint(*_bounds(metadata, 0, 100))
+    if annotation is float:
+        return rng.uniform(*_bounds(metadata, 0.0, 1.0))
+    return f"Synthetic {name.replace('_', ' ')}."
+
+
+def synthetic_output(schema, rng: random.Random):
+    """
+    An instance of a pydantic schema with every field filled in within its constraints
+    """
+    values = {
+        name: _synthetic_value(field.annotation, field.metadata, rng, name)
+        for name, field in schema.model_fields.items()
+    }
+    return schema(**values)
+
+
+class OfflineChatModel:
+    """
+    Chat model stand-in with synthetic, replay and record modes.
+    latency_ms and latency_sigma give a lognormal latency (median and log-space spread); error_rate is the share of
+    calls that raise SyntheticAPIError with one of error_codes. Outputs are seeded by the request fingerprint, so the
+    same request always gets the same answer; latency and failures are drawn per call, so a retry can succeed.
+    """
+
+    def __init__(self, mode: str = "synthetic", replay_path: str = DEFAULT_REPLAY_PATH, chat_model=None,
+                 latency_ms: float = 0.0, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 error_codes: tuple = (429, 500, 503), seed: int = 0, replay_fallback: bool = False):
+        if mode not in ("synthetic", "replay", "record"):
+            raise ValueError(f"Unknown offline mode {mode}, choose from synthetic, replay, record")
+        if mode == "record" and chat_model is None:
+            raise ValueError("Record mode needs the chat model to record")
+        self.mode = mode
+        self.replay_path = replay_path
+        self.chat_model = chat_model
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.seed = seed
+        self.replay_fallback = replay_fallback
+        if mode == "record":
+            # Recorded calls go to the real deployment: the rate limiter, judgment cache and prices must see it
+            self.deployment_name = getattr(chat_model, "deployment_name", None)
+            self.model = getattr(chat_model, "model", None) or getattr(chat_model, "model_name", None)
+        else:
+            self.model = mode if mode == "synthetic" else f"{mode}:{os.path.basename(replay_path)}"
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._recordings = self._load_recordings() if mode == "replay" else {}
+
+    def _load_recordings(self) -> dict:
+        recordings = {}
+        if not os.path.exists(self.replay_path):
+            if not self.replay_fallback:
+                raise FileNotFoundError(f"No recordings at {self.replay_path}, record them with mode='record' first")
+            return recordings
+        with open(self.replay_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["fingerprint"]] = entry["response"]
+        return recordings
+
+    def _record(self, key: str, schema, response):
+        entry = {"fingerprint": key, "schema": schema.__name__, "response": response.model_dump(), "recorded_at": time.time()}
+        with self._lock:
+            if os.path.dirname(self.replay_path):
+                os.makedirs(os.path.dirname(self.replay_path), exist_ok=True)
+            with open(self.replay_path, "a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._recordings[key] = entry["response"]
+
+    def _delay(self) -> float:
+        if not self.latency_ms:
+            return 0.0
+        with self._lock:
+            return self._rng.lognormvariate(0.0, self.latency_sigma) * self.latency_ms / 1000
+
+    def _respond(self, schema, key: str):
+        """
+        The response for a fingerprint in synthetic or replay mode, or the simulated error to raise
+        """
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate and self._rng.random() < self.error_rate
+            if failed:
+                raise SyntheticAPIError(self._rng.choice(self.error_codes))
+        if self.mode == "replay":
+            if key in self._recordings:
+                return schema.model_validate(self._recordings[key])
+            if not self.replay_fallback:
+                raise ReplayMissError(f"No recorded response for request {key[:12]}")
+        return synthetic_output(schema, random.Random(f"{self.seed}:{key}"))
+
+    def with_structured_output(self, schema, **kwargs):
+        return _StructuredOfflineModel(self, schema)
+
+
+class _StructuredOfflineModel:
+    def __init__(self, model: OfflineChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def invoke(self, messages, config=None, **kwargs):
+        key = fingerprint(self.schema, messages)
+        if self.model.mode == "record":
+            response = self.model.chat_model.with_structured_output(self.schema).invoke(messages, config=config)
+            self.model._record(key, self.schema, response)
+            return response
+        time.sleep(self.model._delay())
+        return self.model._respond(self.schema, key)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        key = fingerprint(self.schema, messages)
+        if self.model.mode == "record":
+            response = await self.model.chat_model.with_structured_output(self.schema).ainvoke(messages, config=config)
+            self.model._record(key, self.schema, response)
+            return response
+        delay = self.model._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self.model._respond(self.schema, key)
+
+
+def from_env(mode: str) -> OfflineChatModel:
+    """
+    Offline chat model configured by OFFLINE_* environment variables, for --evaluator synthetic|replay|record
+    """
+    chat_model = None
+    if mode == "record":
+        from tools.evaluator import make_chat_model
+        chat_model = make_chat_model(os.getenv("OFFLINE_RECORD_EVALUATOR", "gpt4o"))
+    return OfflineChatModel(
+        mode=mode,
+        replay_path=os.getenv("OFFLINE_REPLAY_PATH") or DEFAULT_REPLAY_PATH,
+        chat_model=chat_model,
+        latency_ms=float(os.getenv("OFFLINE_LATENCY_MS") or 0),
+        latency_sigma=float(os.getenv("OFFLINE_LATENCY_SIGMA") or 0.5),
+        error_rate=float(os.getenv("OFFLINE_ERROR_RATE") or 0),
+        seed=int(os.getenv("OFFLINE_SEED") or 0),
+        replay_fallback=(os.getenv("OFFLINE_REPLAY_FALLBACK") or "").lower() in ("1", "true", "yes"),
+    )
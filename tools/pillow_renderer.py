@@ -0,0 +1,316 @@
+"""
+Headless banner renderer. Composites the developer stage's layout dict with Pillow instead of Figma desktop.
+
+The layout is the same specification that is handed to the developer prompt. Elements are read from any of
+    "text_elements": [{"text", "position": {"x", "y"}, "width", "font_family", "font_size", "font_weight", "color", "alignment", "line_height"}]
+    "cta_button": {"text", "position", "size": {"width", "height"}, "background_color", "text_color", "font_family", "font_size", "corner_radius"}
+    "logo": {"position", "size": {"width", "height"}}
+    "elements": [{"type": "text" | "button" | "logo", ...}]
+Positions and sizes may also be given flat as "x", "y", "width", "height". Only absolute positions are used,
+as in the Figma plugin. Colors are CSS strings ("#1a2b3c", "white", "rgb(...)") or Figma style {"r", "g", "b"} dicts.
+"""
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+FONT_DIRS = [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    os.path.expanduser("~/Library/Fonts"),
+    "C:\\Windows\\Fonts",
+]
+FALLBACK_FONTS = ["DejaVuSans", "Arial", "Helvetica", "LiberationSans"]
+BOLD_WEIGHTS = {"bold", "700", "800", "900", "semibold", "600", "extrabold", "black", "heavy"}
+
+
+def _normalize_font_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+@lru_cache(maxsize=1)
+def _font_index() -> dict:
+    """
+    Map of normalized font file stems ("opensansbold") to their paths, for every font under FONT_DIRS
+    """
+    index = {}
+    for font_dir in FONT_DIRS:
+        for root, _, files in os.walk(font_dir):
+            for name in files:
+                stem, ext = os.path.splitext(name)
+                if ext.lower() in (".ttf", ".otf", ".ttc"):
+                    index.setdefault(_normalize_font_name(stem), os.path.join(root, name))
+    return index
+
+
+@lru_cache(maxsize=256)
+def load_font(family: str = None, size: int = 16, weight: str = None):
+    """
+    Find the closest installed font for a family and weight, falling back to a common sans serif
+    """
+    index = _font_index()
+    bold = str(weight).lower() in BOLD_WEIGHTS if weight is not None else False
+    for candidate in ([family] if family else []) + FALLBACK_FONTS:
+        base = _normalize_font_name(candidate)
+        names = [base + "bold", base + "boldmt", base + "regular", base] if bold else [base + "regular", base, base + "mt"]
+        for name in names:
+            if name in index:
+                try:
+                    return ImageFont.truetype(index[name], size)
+                except OSError:
+                    continue
+    return ImageFont.load_default(size)
+
+
+def parse_color(value, default=(0, 0, 0, 255)):
+    if value is None:
+        return default
+    if isinstance(value, dict):
+        channels = [value.get(c, 0) for c in ("r", "g", "b")]
+        alpha = value.get("a", 1)
+        # Figma colors are 0-1 floats
+        scale = 255 if all(c <= 1 for c in channels) else 1
+        return tuple(int(round(c * scale)) for c in channels) + (int(round(alpha * 255 if alpha <= 1 else alpha)),)
+    if isinstance(value, (list, tuple)):
+        return tuple(value) + (255,) * (4 - len(value))
+    color = ImageColor.getrgb(str(value).strip())
+    return color if len(color) == 4 else color + (255,)
+
+
+def parse_number(value, default=0.0):
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r"\s*(-?[\d.]+)", str(value))
+    return float(match.group(1)) if match else default
+
+
+def _box(spec: dict):
+    """
+    (x, y, width, height) of an element, width/height are None when unspecified
+    """
+    position = spec.get("position") or {}
+    size = spec.get("size") or {}
+    x = parse_number(position.get("x", spec.get("x")))
+    y = parse_number(position.get("y", spec.get("y")))
+    width = size.get("width", spec.get("width"))
+    height = size.get("height", spec.get("height"))
+    return x, y, None if width is None else parse_number(width), None if height is None else parse_number(height)
+
+
+def iter_elements(layout: dict):
+    """
+    Yield (kind, spec) for every element of a layout, kind being "text", "button" or "logo"
+    """
+    for element in layout.get("elements", []):
+        kind = str(element.get("type", "text")).lower()
+        yield ("button" if kind in ("cta", "button", "cta_button") else "logo" if kind in ("logo", "image") else "text"), element
+    for element in layout.get("text_elements", []):
+        yield "text", element
+    if layout.get("cta_button"):
+        yield "button", layout["cta_button"]
+    if layout.get("logo"):
+        yield "logo", layout["logo"]
+
+
+def _wrap(draw, text, font, max_width):
+    if max_width is None:
+        return text.split("\n")
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}".strip()
+            if line and draw.textlength(candidate, font=font) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _text_style(spec):
+    font_size = int(parse_number(spec.get("font_size", spec.get("fontSize")), 16))
+    font = load_font(spec.get("font_family", spec.get("font")), font_size, spec.get("font_weight", spec.get("fontWeight")))
+    line_height = spec.get("line_height")
+    line_height = parse_number(line_height) * (font_size if parse_number(line_height) < 4 else 1) if line_height else font_size * 1.2
+    return font, font_size, line_height
+
+
+def _button_style(draw, spec):
+    font_size = int(parse_number(spec.get("font_size", spec.get("fontSize")), 16))
+    font = load_font(spec.get("font_family", spec.get("font")), font_size, spec.get("font_weight", "bold"))
+    x, y, width, height = _box(spec)
+    if width is None:
+        width = draw.textlength(str(spec.get("text", "")), font=font) + font_size * 2
+    if height is None:
+        height = font_size * 2.4
+    return font, (x, y, width, height)
+
+
+def _draw_text(draw, spec):
+    x, y, width, _ = _box(spec)
+    font, _, line_height = _text_style(spec)
+    fill = parse_color(spec.get("color", spec.get("font_color")))
+    alignment = str(spec.get("alignment", spec.get("text_align", "left"))).lower()
+
+    for i, line in enumerate(_wrap(draw, str(spec.get("text", "")), font, width)):
+        line_width = draw.textlength(line, font=font)
+        if alignment == "center" and width is not None:
+            line_x = x + (width - line_width) / 2
+        elif alignment == "right" and width is not None:
+            line_x = x + width - line_width
+        else:
+            line_x = x
+        draw.text((line_x, y + i * line_height), line, font=font, fill=fill)
+
+
+def _draw_button(draw, spec):
+    font, (x, y, width, height) = _button_style(draw, spec)
+    radius = parse_number(spec.get("corner_radius", spec.get("border_radius")), height / 4)
+    draw.rounded_rectangle(
+        [x, y, x + width, y + height],
+        radius=radius,
+        fill=parse_color(spec.get("background_color", spec.get("button_color")), (0, 0, 0, 255)),
+        outline=parse_color(spec["border_color"]) if spec.get("border_color") else None,
+        width=int(parse_number(spec.get("border_width"), 1)),
+    )
+    draw.text((x + width / 2, y + height / 2), str(spec.get("text", "")), font=font, anchor="mm",
+              fill=parse_color(spec.get("text_color", spec.get("color")), (255, 255, 255, 255)))
+
+
+_measure_draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+
+def measure_element(kind: str, spec: dict, logo_size: tuple = None):
+    """
+    (x, y, width, height) an element occupies when rendered by render_layout.
+    logo_size is the logo image's (width, height), used to keep its aspect ratio when only one side is given.
+    """
+    if kind == "button":
+        return _button_style(_measure_draw, spec)[1]
+    x, y, width, height = _box(spec)
+    if kind == "logo":
+        aspect = logo_size[0] / logo_size[1] if logo_size else 1.0
+        if width is None and height is None:
+            width, height = logo_size if logo_size else (0.0, 0.0)
+        elif width is None:
+            width = height * aspect
+        elif height is None:
+            height = width / aspect
+        return x, y, float(width), float(height)
+    font, _, line_height = _text_style(spec)
+    lines = _wrap(_measure_draw, str(spec.get("text", "")), font, width)
+    if width is None:
+        width = max(_measure_draw.textlength(line, font=font) for line in lines)
+    if height is None:
+        height = line_height * len(lines)
+    return x, y, float(width), float(height)
+
+
+def _paste_logo(canvas, spec, logo_image):
+    x, y, width, height = _box(spec)
+    if isinstance(logo_image, str) and logo_image.lower().endswith(".svg"):
+        # Rasterized at the requested size through the logo cache, so the resize below is a no-op
+        from tools.logo_rasterizer import rasterize_logo
+        logo_image = rasterize_logo(logo_image, None if width is None else round(width), None if height is None else round(height))
+    logo = Image.open(logo_image).convert("RGBA") if isinstance(logo_image, str) else logo_image.convert("RGBA")
+    if width is None and height is None:
+        width, height = logo.size
+    elif width is None:
+        width = logo.width * height / logo.height
+    elif height is None:
+        height = logo.height * width / logo.width
+    if logo.size != (max(1, round(width)), max(1, round(height))):
+        logo = logo.resize((max(1, round(width)), max(1, round(height))), Image.LANCZOS)
+    canvas.alpha_composite(logo, (round(x), round(y)))
+
+
+def _cover(image, width, height):
+    """
+    Scale and center-crop an image so it fills width x height
+    """
+    scale = max(width / image.width, height / image.height)
+    image = image.resize((max(width, round(image.width * scale)), max(height, round(image.height * scale))), Image.LANCZOS)
+    left, top = (image.width - width) // 2, (image.height - height) // 2
+    return image.crop((left, top, left + width, top + height))
+
+
+def render_layout(layout: dict, background_image=None, logo_image=None, output_path: str = None, width: int = None, height: int = None):
+    """
+    Render a layout onto its background at background_width x background_height.
+    Returns output_path when given, otherwise the rendered RGB image.
+    """
+    width = int(width or parse_number(layout.get("background_width"), 0) or 0)
+    height = int(height or parse_number(layout.get("background_height"), 0) or 0)
+    background_image = background_image or layout.get("background_image")
+    logo_image = logo_image or layout.get("logo_image")
+
+    if background_image is not None:
+        background = Image.open(background_image) if isinstance(background_image, str) else background_image
+        background = background.convert("RGBA")
+        width, height = width or background.width, height or background.height
+        canvas = _cover(background, width, height)
+    else:
+        if not width or not height:
+            raise ValueError("The layout needs background_width and background_height when no background image is given")
+        canvas = Image.new("RGBA", (width, height), parse_color(layout.get("background_color"), (255, 255, 255, 255)))
+
+    draw = ImageDraw.Draw(canvas)
+    for kind, spec in iter_elements(layout):
+        if kind == "logo":
+            if logo_image is not None or spec.get("image"):
+                _paste_logo(canvas, spec, logo_image or spec["image"])
+                draw = ImageDraw.Draw(canvas)
+        elif kind == "button":
+            _draw_button(draw, spec)
+        else:
+            _draw_text(draw, spec)
+
+    image = canvas.convert("RGB")
+    if output_path is None:
+        return image
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    image.save(output_path)
+    return output_path
+
+
+def _render_job(job: dict) -> str:
+    return render_layout(**job)
+
+
+def render_many(jobs: list, max_workers: int = None) -> list:
+    """
+    Render several layouts in a process pool. Each job holds the keyword arguments of render_layout,
+    including output_path. Returns the output paths in job order.
+    """
+    if any(not job.get("output_path") for job in jobs):
+        raise ValueError("Every render job needs an output_path")
+    if len(jobs) <= 1 or max_workers == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_render_job, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a banner layout JSON with Pillow")
+    parser.add_argument("layout", type=str, help="Path to the layout JSON")
+    parser.add_argument("--background_image", type=str, help="Background image, defaults to the layout's background_image")
+    parser.add_argument("--logo_image", type=str, help="Logo image, defaults to the layout's logo_image")
+    parser.add_argument("--output", type=str, help="Where to save the rendered png", default="rendered.png")
+    args = parser.parse_args()
+
+    with open(args.layout, "r") as f:
+        layout = json.load(f)
+    print(render_layout(layout, args.background_image, args.logo_image, args.output))
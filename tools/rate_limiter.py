@@ -0,0 +1,451 @@
+"""
+Token-bucket scheduler in front of LLM calls, shared by every worker process on a host.
+
+Each provider deployment (the model name tools.tracing records, e.g. "AzureChatOpenAI/gpt-4o") has a requests and a
+tokens per minute budget. Its buckets live in a small JSON state file under .cache/ratelimits, updated under an
+exclusive file lock, so several eval.py or agent processes share one budget. A call's tokens are estimated up front
+from its prompt text, image sizes and output reservation. Calls wait for their budget, lower priority values first
+(interactive generation before batch eval). 429s and overload errors block the whole deployment for the retry-after
+the provider asked for (or an exponential backoff) plus jitter, and drain the request bucket so that waiting calls
+resume at the budgeted rate instead of in lockstep. Rate-limit headers that report less remaining budget than the
+buckets hold shrink them, and a lower limit than configured is adopted. Those headers are read from every error
+response, and from successful ones where the client reports them (AzureChatOpenAI/ChatOpenAI with
+include_response_headers; ChatAnthropic does not). The SDK clients are built without their own retries while a
+scheduler is set, so retries stay within the shared budget.
+
+    set_scheduler(Scheduler())  # tools.tracing.ainvoke then schedules every LLM call
+
+Try it against a local fake provider that returns 429s:
+    python -m tools.rate_limiter serve --rpm 120
+    python -m tools.rate_limiter load --processes 4 --requests 100 --rpm 120
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows, the buckets are then only shared within one process
+    fcntl = None
+
+DEFAULT_STATE_DIR = os.path.join(".cache", "ratelimits")
+# Requests and tokens per minute by model name prefix; RATE_LIMITS (JSON) in the environment overrides or adds
+# entries, e.g. {"AzureChatOpenAI/my-deployment": {"rpm": 900, "tpm": 300000}}
+DEFAULT_LIMITS = {
+    "AzureChatOpenAI": {"rpm": 480, "tpm": 80_000},
+    "ChatOpenAI": {"rpm": 500, "tpm": 30_000},
+    "ChatAnthropic": {"rpm": 50, "tpm": 40_000},
+    "OfflineChatModel": {"rpm": 6_000, "tpm": 10_000_000},
+    "default": {"rpm": 60, "tpm": 100_000},
+}
+# Lower goes first: interactive generation stages before batch evaluation
+STAGE_PRIORITY = {"eval": 10}
+# Output tokens reserved per call, as the providers count max_tokens against the budget
+DEFAULT_MAX_OUTPUT_TOKENS = 1000
+RETRY_STATUSES = {429, 500, 502, 503, 529}
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+# Extra random share of the backoff, so that processes do not retry in lockstep
+JITTER = 0.25
+# How often lower-priority waiters look again, and when a waiter that stopped polling is forgotten
+POLL_S = 0.05
+WAITER_TTL_S = 5.0
+
+
+def _duration(value) -> float:
+    """
+    Seconds of a header value: "1.5", "6m0s", "20ms", or an RFC 3339 reset time
+    """
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit] for number, unit in parts)
+    reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_rate_limit_headers(headers) -> dict:
+    """
+    Retry-after, limits, remaining budget and reset times from OpenAI/Azure (x-ratelimit-*) or Anthropic
+    (anthropic-ratelimit-*) response headers
+    """
+    if not headers:
+        return {}
+    headers = {str(key).lower(): value for key, value in dict(headers).items()}
+    info = {}
+    try:
+        if "retry-after-ms" in headers:
+            info["retry_after"] = float(headers["retry-after-ms"]) / 1000
+        elif "retry-after" in headers:
+            info["retry_after"] = _duration(headers["retry-after"])
+        for kind in ("requests", "tokens"):
+            for field in ("limit", "remaining", "reset"):
+                # OpenAI/Azure name them x-ratelimit-remaining-requests, Anthropic anthropic-ratelimit-requests-remaining
+                value = headers.get(f"x-ratelimit-{field}-{kind}", headers.get(f"anthropic-ratelimit-{kind}-{field}"))
+                if value is not None:
+                    info[f"{field}_{kind}"] = _duration(value) if field == "reset" else float(value)
+    except ValueError:
+        pass
+    return info
+
+
+def _status(error):
+    return getattr(error, "status_code", None) or getattr(error, "code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _headers(error):
+    return getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+
+
+def estimate_tokens(messages, model: str = None, max_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> int:
+    """
+    Tokens a call will count against the budget: its prompt text, its images at the provider's tile/pixel rate,
+    and the reserved output tokens
+    """
+    from tools.tracing import count_tokens, payload_stats
+
+    texts = []
+    for message in messages or []:
+        content = getattr(message, "content", message.get("content") if isinstance(message, dict) else message)
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict):
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+            else:
+                texts.append(str(part))
+    return count_tokens("\n".join(texts)) + payload_stats(messages or [], model)["image_tokens"] + max_tokens
+
+
+class RateLimiter:
+    """
+    Requests and tokens per minute buckets of one deployment, in a state file shared by all processes
+    """
+
+    def __init__(self, key: str, rpm: float, tpm: float, state_dir: str = DEFAULT_STATE_DIR):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json")
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    @contextmanager
+    def _state(self):
+        """
+        The bucket state, refilled up to now, under the process and file locks; changes are written back
+        """
+        with self._lock, open(self.path, "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read()
+                now = time.time()
+                state = json.loads(text) if text.strip() else {
+                    "requests": self.rpm, "tokens": self.tpm, "updated": now, "blocked_until": 0.0,
+                    "waiters": {}, "granted": 0, "throttled": 0, "waited_s": 0.0,
+                }
+                elapsed = max(0.0, now - state["updated"])
+                state["requests"] = min(self.rpm, state["requests"] + elapsed * self.rpm / 60)
+                state["tokens"] = min(self.tpm, state["tokens"] + elapsed * self.tpm / 60)
+                state["updated"] = now
+                yield state, now
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    async def acquire(self, tokens: int, priority: int = 0) -> float:
+        """
+        Wait until one request and `tokens` tokens are available and no waiting call has a lower priority value,
+        then take them. Returns the seconds waited.
+        """
+        waiter = f"{os.getpid()}-{id(self)}-{next(self._ids)}"
+        tokens = min(tokens, self.tpm)
+        enqueued = time.time()
+        granted = False
+        try:
+            while True:
+                with self._state() as (state, now):
+                    waiters = state["waiters"]
+                    waiters[waiter] = [priority, enqueued, now]
+                    for other, (_, _, seen) in list(waiters.items()):
+                        if now - seen > WAITER_TTL_S:
+                            del waiters[other]
+                    ahead = any(other_priority < priority for other_priority, _, _ in waiters.values())
+                    delay = max(state["blocked_until"] - now, (1 - state["requests"]) * 60 / self.rpm,
+                                (tokens - state["tokens"]) * 60 / self.tpm, 0.0)
+                    if not ahead and delay <= 0:
+                        state["requests"] -= 1
+                        state["tokens"] -= tokens
+                        state["granted"] += 1
+                        state["waited_s"] += now - enqueued
+                        del waiters[waiter]
+                        granted = True
+                        return now - enqueued
+                await asyncio.sleep(min(max(delay, 0.001), POLL_S) if not ahead else POLL_S)
+        finally:
+            if not granted:
+                with self._state() as (state, _):
+                    state["waiters"].pop(waiter, None)
+
+    def throttle(self, attempt: int, headers=None) -> float:
+        """
+        Block the deployment after a 429 or overload error for the retry-after in headers, or an exponential
+        backoff, plus jitter. Returns the delay.
+        """
+        delay = parse_rate_limit_headers(headers).get("retry_after")
+        if delay is None:
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+        delay += random.uniform(0, JITTER * delay + 0.1)
+        with self._state() as (state, now):
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+            # Resume at the budgeted rate rather than all at once
+            state["requests"] = min(state["requests"], 0.0)
+            state["throttled"] += 1
+        return delay
+
+    def observe(self, headers):
+        """
+        Shrink the buckets to the remaining budget a response reported, and wait for the reset when it is used up.
+        A lower per-minute limit than configured is adopted for the rest of the run.
+        """
+        info = parse_rate_limit_headers(headers)
+        if not info:
+            return
+        self.rpm = min(self.rpm, info.get("limit_requests", self.rpm))
+        self.tpm = min(self.tpm, info.get("limit_tokens", self.tpm))
+        with self._state() as (state, now):
+            if "remaining_requests" in info:
+                state["requests"] = min(state["requests"], info["remaining_requests"])
+                if info["remaining_requests"] < 1 and "reset_requests" in info:
+                    state["blocked_until"] = max(state["blocked_until"], now + info["reset_requests"])
+            if "remaining_tokens" in info:
+                state["tokens"] = min(state["tokens"], info["remaining_tokens"])
+
+    def stats(self) -> dict:
+        with self._state() as (state, _):
+            return {"key": self.key, "rpm": self.rpm, "tpm": self.tpm, "granted": state["granted"], "throttled": state["throttled"],
+                    "waited_s": round(state["waited_s"], 3), "waiting": len(state["waiters"])}
+
+
+class Scheduler:
+    """
+    RateLimiters by deployment, and the retry loop around each call
+    """
+
+    def __init__(self, limits: dict = None, state_dir: str = DEFAULT_STATE_DIR, max_attempts: int = MAX_ATTEMPTS):
+        self.limits = {**DEFAULT_LIMITS, **json.loads(os.getenv("RATE_LIMITS") or "{}"), **(limits or {})}
+        self.state_dir = state_dir
+        self.max_attempts = max_attempts
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str = None) -> RateLimiter:
+        key = model or "default"
+        with self._lock:
+            if key not in self._limiters:
+                prefix = max((name for name in self.limits if key.startswith(name)), key=len, default="default")
+                self._limiters[key] = RateLimiter(key, self.limits[prefix]["rpm"], self.limits[prefix]["tpm"], self.state_dir)
+            return self._limiters[key]
+
+    async def run(self, call, messages=None, model: str = None, stage: str = None, priority: int = None,
+                  max_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS, tokens: int = None, headers=None):
+        """
+        await call() once the deployment's budget allows, retrying 429s and overload errors after the backoff.
+        headers(result) may return the response headers of a successful call, to track the provider's own count.
+        """
+        limiter = self.limiter(model)
+        priority = STAGE_PRIORITY.get(stage, 0) if priority is None else priority
+        tokens = estimate_tokens(messages, model, max_tokens) if tokens is None else tokens
+        for attempt in range(self.max_attempts):
+            await limiter.acquire(tokens, priority)
+            try:
+                result = await call()
+            except Exception as e:
+                if _status(e) not in RETRY_STATUSES or attempt == self.max_attempts - 1:
+                    raise
+                limiter.observe(_headers(e))
+                limiter.throttle(attempt, _headers(e))
+                continue
+            if headers is not None:
+                limiter.observe(headers(result))
+            return result
+
+    def stats(self) -> list:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return [limiter.stats() for limiter in limiters]
+
+
+_scheduler = None
+
+
+def set_scheduler(scheduler):
+    """
+    Schedule every tools.tracing.ainvoke call through scheduler, or stop with None. Returns the previous scheduler.
+    """
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    return previous
+
+
+def get_scheduler():
+    return _scheduler
+
+
+def serve(port: int = 8765, rpm: float = 120, tpm: float = 1e9):
+    """
+    Fake OpenAI-style provider enforcing its own token buckets: POST /v1/chat/completions answers 429 with
+    retry-after and x-ratelimit-* headers beyond the budget, GET /stats reports the counts
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+    bucket = {"requests": rpm, "tokens": tpm, "updated": time.time(), "ok": 0, "limited": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            for key, value in {"content-type": "application/json", "content-length": len(data), **(headers or {})}.items():
+                self.send_header(key, str(value))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            with lock:
+                self._send(200, {key: bucket[key] for key in ("ok", "limited")})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("content-length") or 0)) or b"{}")
+            tokens = len(json.dumps(body.get("messages", []))) // 4 + int(body.get("max_tokens") or 0)
+            with lock:
+                now = time.time()
+                bucket["requests"] = min(rpm, bucket["requests"] + (now - bucket["updated"]) * rpm / 60)
+                bucket["tokens"] = min(tpm, bucket["tokens"] + (now - bucket["updated"]) * tpm / 60)
+                bucket["updated"] = now
+                allowed = bucket["requests"] >= 1 and bucket["tokens"] >= tokens
+                if allowed:
+                    bucket["requests"] -= 1
+                    bucket["tokens"] -= tokens
+                    bucket["ok"] += 1
+                else:
+                    bucket["limited"] += 1
+                headers = {
+                    "x-ratelimit-limit-requests": int(rpm),
+                    "x-ratelimit-remaining-requests": int(bucket["requests"]),
+                    "x-ratelimit-remaining-tokens": int(bucket["tokens"]),
+                    "x-ratelimit-reset-requests": f"{max(0.0, 1 - bucket['requests']) * 60 / rpm:.3f}s",
+                }
+            if not allowed:
+                headers["retry-after"] = f"{max(0.0, 1 - bucket['requests']) * 60 / rpm:.3f}"
+                return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+            self._send(200, {"object": "chat.completion", "model": body.get("model"), "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": '{"score": 4, "explanation": "Fake."}'}}],
+                "usage": {"prompt_tokens": tokens, "completion_tokens": 8}}, headers)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Fake provider on http://127.0.0.1:{port} at {rpm:g} rpm")
+    server.serve_forever()
+
+
+def _post(url: str, payload: dict):
+    import urllib.request
+
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"content-type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read()), dict(response.headers)
+
+
+async def _load_worker(url: str, requests: int, concurrency: int, scheduler, priority: int) -> dict:
+    counts = {"ok": 0, "failed": 0, "rate_limited": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    payload = {"model": "fake", "messages": [{"role": "user", "content": "Score this banner."}], "max_tokens": 50}
+
+    async def one():
+        async with semaphore:
+            async def call():
+                try:
+                    return await asyncio.to_thread(_post, url + "/v1/chat/completions", payload)
+                except Exception as e:
+                    if _status(e) == 429:
+                        counts["rate_limited"] += 1
+                    raise
+            try:
+                if scheduler is None:
+                    await call()
+                else:
+                    await scheduler.run(call, payload["messages"], "fake", priority=priority, max_tokens=50, headers=lambda result: result[1])
+                counts["ok"] += 1
+            except Exception:
+                counts["failed"] += 1
+
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return counts
+
+
+def _load_process(args: tuple) -> dict:
+    url, requests, concurrency, rpm, state_dir, priority, use_scheduler = args
+    scheduler = Scheduler({"fake": {"rpm": rpm, "tpm": 1e9}}, state_dir) if use_scheduler else None
+    return asyncio.run(_load_worker(url, requests, concurrency, scheduler, priority))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared LLM rate limiter: fake provider and multi-process load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("serve", help="Run a fake provider that returns 429s beyond its budget")
+    server.add_argument("--port", type=int, default=8765)
+    server.add_argument("--rpm", type=float, default=120)
+    load = commands.add_parser("load", help="Send requests from several processes through the shared scheduler")
+    load.add_argument("--url", type=str, default="http://127.0.0.1:8765")
+    load.add_argument("--processes", type=int, default=4)
+    load.add_argument("--requests", type=int, default=50, help="Requests per process")
+    load.add_argument("--concurrency", type=int, default=16, help="In-flight requests per process")
+    load.add_argument("--rpm", type=float, default=120, help="Budget the scheduler enforces across all processes")
+    load.add_argument("--state_dir", type=str, default=DEFAULT_STATE_DIR)
+    load.add_argument("--no_scheduler", action="store_true", help="Call the provider directly, for comparison")
+    status = commands.add_parser("status", help="Show the shared bucket state")
+    status.add_argument("--state_dir", type=str, default=DEFAULT_STATE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.rpm)
+    elif args.command == "load":
+        from concurrent.futures import ProcessPoolExecutor
+
+        start = time.perf_counter()
+        jobs = [(args.url, args.requests, args.concurrency, args.rpm, args.state_dir, i % 2 * STAGE_PRIORITY["eval"], not args.no_scheduler)
+                for i in range(args.processes)]
+        with ProcessPoolExecutor(args.processes) as pool:
+            results = list(pool.map(_load_process, jobs))
+        elapsed = time.perf_counter() - start
+        total = {key: sum(result[key] for result in results) for key in results[0]}
+        print(json.dumps({**total, "wall_time_s": round(elapsed, 2), "requests_per_min": round(total["ok"] / elapsed * 60, 1)}, indent=2))
+    else:
+        for name in sorted(os.listdir(args.state_dir)) if os.path.isdir(args.state_dir) else []:
+            with open(os.path.join(args.state_dir, name), "r") as f:
+                state = json.load(f)
+            print(json.dumps({"key": name[:-len(".json")], **{k: round(v, 3) if isinstance(v, float) else v for k, v in state.items() if k != "waiters"}, "waiting": len(state["waiters"])}))
@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+import numpy as np
+
+DATASET_DIR = "BannerRequest400"
+DATASETS = {
+    "abstract_400": os.path.join(DATASET_DIR, "abstract_400.jsonl"),
+    "concrete_5k": os.path.join(DATASET_DIR, "concrete_5k.jsonl"),
+}
+# The 13 standard banner dimensions that concrete_5k spreads each abstract request over
+BANNER_SIZES = [
+    (300, 250), (336, 280), (250, 250), (200, 200), (728, 90), (468, 60), (970, 90),
+    (970, 250), (320, 50), (160, 600), (120, 600), (300, 600), (1200, 628),
+]
+INDEX_DIR = os.path.join(".cache", "datasets")
+# Bump when the index layout or the parsed fields change
+INDEX_VERSION = 1
+
+SIZE_PATTERN = re.compile(r"(\d{2,4})\s*[xX×]\s*(\d{2,4})")
+LOGO_PATTERN = re.compile(r"logo path is\s+(\S+?)\.?(?:\s|$)", re.IGNORECASE)
+AUDIENCE_PATTERN = re.compile(r"target audience is\s+(.+?)\.(?:\s|$)", re.IGNORECASE)
+PURPOSE_PATTERN = re.compile(r"primary purpose is\s+(.+?)\.*\s*$", re.IGNORECASE | re.DOTALL)
+LOGO_ID_PATTERN = re.compile(r"(?:^|[/\\])(\d{3})_")
+
+
+@dataclass
+class BannerRequest:
+    """One row of a BannerRequest400 dataset with the fields parsed out of its request"""
+
+    row: int
+    request: str
+    width: int = None
+    height: int = None
+    logo_id: str = None
+    logo_name: str = None
+    logo_png: str = None
+    logo_svg: str = None
+    audience: str = None
+    purpose: str = None
+    extra: dict = None
+
+    @property
+    def size(self) -> str:
+        return f"{self.width}x{self.height}" if self.width and self.height else None
+
+
+@lru_cache(maxsize=8)
+def logo_files(logo_root: str = DATASET_DIR) -> dict:
+    """
+    Map of logo id ("001") to its name and its files under logos_png and logos_svg
+    """
+    logos = {}
+    for folder, ext in (("logos_png", ".png"), ("logos_svg", ".svg")):
+        directory = os.path.join(logo_root, folder)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            stem, file_ext = os.path.splitext(name)
+            match = re.match(r"(\d{3})_(.+)", stem)
+            if file_ext.lower() == ext and match:
+                logo = logos.setdefault(match.group(1), {"name": match.group(2), "png": None, "svg": None})
+                logo[ext[1:]] = os.path.join(directory, name)
+    return logos
+
+
+def _field(row: dict, *keys):
+    for key in keys:
+        if row.get(key) not in (None, ""):
+            return row[key]
+    return None
+
+
+def parse_request(row, index: int = 0, logo_root: str = DATASET_DIR) -> BannerRequest:
+    """
+    Typed record of a dataset row. abstract_400 rows are bare request strings; object rows (concrete_5k)
+    are read from their fields where present and from the request text otherwise.
+    """
+    fields = row if isinstance(row, dict) else {}
+    text = row if isinstance(row, str) else _field(fields, "banner_request", "request", "prompt", "text") or json.dumps(row, ensure_ascii=False)
+
+    width, height = _field(fields, "width", "banner_width"), _field(fields, "height", "banner_height")
+    size = _field(fields, "size", "dimension", "dimensions")
+    match = SIZE_PATTERN.search(str(size)) if size else None
+    match = match or SIZE_PATTERN.search(re.split(r"logo path", text, flags=re.IGNORECASE)[0]) or SIZE_PATTERN.search(text)
+    if (width is None or height is None) and match:
+        width, height = match.groups()
+
+    logo = _field(fields, "logo_id", "logo", "logo_path", "logo_file")
+    if logo is None:
+        match = LOGO_PATTERN.search(text)
+        logo = match.group(1) if match else None
+    logo_id = None
+    if logo is not None:
+        match = LOGO_ID_PATTERN.search(str(logo)) or re.fullmatch(r"\s*(\d{1,3})\s*", str(logo))
+        logo_id = match.group(1).zfill(3) if match else None
+
+    audience = _field(fields, "target_audience", "audience")
+    if audience is None:
+        match = AUDIENCE_PATTERN.search(text)
+        audience = match.group(1).strip() if match else None
+    purpose = _field(fields, "primary_purpose", "purpose")
+    if purpose is None:
+        match = PURPOSE_PATTERN.search(text)
+        purpose = match.group(1).strip() if match else None
+
+    logo = logo_files(logo_root).get(logo_id, {})
+    known = {"banner_request", "request", "prompt", "text", "width", "banner_width", "height", "banner_height", "size",
+             "dimension", "dimensions", "logo_id", "logo", "logo_path", "logo_file", "target_audience", "audience",
+             "primary_purpose", "purpose"}
+    return BannerRequest(
+        row=index,
+        request=text,
+        width=int(width) if width is not None else None,
+        height=int(height) if height is not None else None,
+        logo_id=logo_id,
+        logo_name=logo.get("name"),
+        logo_png=logo.get("png"),
+        logo_svg=logo.get("svg"),
+        audience=audience,
+        purpose=purpose,
+        extra={key: value for key, value in fields.items() if key not in known} or None,
+    )
+
+
+def _index_path(path: str) -> str:
+    digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(INDEX_DIR, f"{os.path.splitext(os.path.basename(path))[0]}.{digest}.npz")
+
+
+class RequestDataset:
+    """
+    Random-access view of a request JSONL file. A byte-offset index, with the size, logo and audience of every row,
+    is built on first use and persisted under .cache/datasets, so rows are read one seek at a time and
+    filters never touch the file.
+    """
+
+    def __init__(self, path: str, logo_root: str = None, index_path: str = None):
+        self.path = DATASETS.get(path, path)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Dataset not found: {self.path}")
+        self.logo_root = logo_root or os.path.dirname(self.path) or "."
+        self.index_path = index_path or _index_path(self.path)
+        self.index = self._load_index()
+
+    def _source_stamp(self):
+        stat = os.stat(self.path)
+        return np.array([INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _load_index(self) -> dict:
+        stamp = self._source_stamp()
+        if os.path.exists(self.index_path):
+            try:
+                with np.load(self.index_path, allow_pickle=False) as index:
+                    if np.array_equal(index["stamp"], stamp):
+                        return {key: index[key] for key in index.files}
+            except (OSError, ValueError, KeyError):
+                pass
+        return self.build_index()
+
+    def build_index(self) -> dict:
+        """
+        Scan the file once, recording each row's byte offset and filter fields, and save the index
+        """
+        offsets, widths, heights, logo_ids, audiences = [], [], [], [], []
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    record = parse_request(json.loads(line), len(offsets), self.logo_root)
+                    offsets.append(offset)
+                    widths.append(record.width or 0)
+                    heights.append(record.height or 0)
+                    logo_ids.append(record.logo_id or "")
+                    audiences.append((record.audience or "").lower())
+                offset += len(line)
+        index = {
+            "stamp": self._source_stamp(),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "width": np.array(widths, dtype=np.int32),
+            "height": np.array(heights, dtype=np.int32),
+            "logo_id": np.array(logo_ids, dtype="<U3"),
+            "audience": np.array(audiences, dtype=str),
+        }
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        # Write then rename, so concurrent workers never load a half-written index
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **index)
+        os.replace(tmp_path, self.index_path)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.index["offsets"])
+
+    def __getitem__(self, row: int) -> BannerRequest:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Row {row} out of range for {len(self)} rows")
+        with open(self.path, "rb") as f:
+            f.seek(int(self.index["offsets"][row]))
+            return parse_request(json.loads(f.readline()), row, self.logo_root)
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, rows=None):
+        """
+        Stream the given rows (all rows by default) in order, reading only those lines
+        """
+        rows = range(len(self)) if rows is None else rows
+        with open(self.path, "rb") as f:
+            for row in rows:
+                f.seek(int(self.index["offsets"][row]))
+                yield parse_request(json.loads(f.readline()), int(row), self.logo_root)
+
+    def filter(self, width: int = None, height: int = None, size: str = None, logo=None, audience: str = None) -> np.ndarray:
+        """
+        Row numbers matching every given filter, from the index alone.
+        size is "WxH"; logo is an id (1, "001") or name ("ethicai"); audience matches case-insensitively.
+        Each filter may also be a list of accepted values.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if size is not None:
+            sizes = [size] if isinstance(size, str) else size
+            dims = [tuple(int(v) for v in SIZE_PATTERN.fullmatch(s.strip()).groups()) for s in sizes]
+            mask &= np.any([(self.index["width"] == w) & (self.index["height"] == h) for w, h in dims], axis=0)
+        if width is not None:
+            mask &= np.isin(self.index["width"], np.atleast_1d(width))
+        if height is not None:
+            mask &= np.isin(self.index["height"], np.atleast_1d(height))
+        if logo is not None:
+            names = {info["name"].lower(): logo_id for logo_id, info in logo_files(self.logo_root).items()}
+            logo_ids = [names.get(str(value).lower(), str(value).zfill(3)) for value in np.atleast_1d(logo)]
+            mask &= np.isin(self.index["logo_id"], logo_ids)
+        if audience is not None:
+            mask &= np.isin(self.index["audience"], [value.lower() for value in np.atleast_1d(audience)])
+        return np.nonzero(mask)[0]
+
+    def shard(self, shard: int, num_shards: int, rows=None) -> np.ndarray:
+        """
+        Deterministic share of the rows for worker `shard` of `num_shards`. Rows are dealt round-robin,
+        so every worker gets a similar mix of sizes and logos and shards never overlap.
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"Shard {shard} out of range for {num_shards} shards")
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        return rows[shard::num_shards]
+
+
+def load_dataset(name: str = "abstract_400", **kwargs) -> RequestDataset:
+    """
+    Open a dataset by name ("abstract_400", "concrete_5k") or path
+    """
+    return RequestDataset(name, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream, filter and shard BannerRequest400 request rows as JSONL")
+    parser.add_argument("dataset", type=str, nargs="?", default="abstract_400", help="Dataset name or path to a JSONL file")
+    parser.add_argument("--size", type=str, nargs="+", help="Banner dimensions, e.g. 300x250")
+    parser.add_argument("--logo", type=str, nargs="+", help="Logo ids or names")
+    parser.add_argument("--audience", type=str, nargs="+")
+    parser.add_argument("--shard", type=str, help="Worker share as INDEX/COUNT, e.g. 0/4")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--rebuild_index", action="store_true")
+    parser.add_argument("--count", action="store_true", help="Only print the number of matching rows")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset)
+    if args.rebuild_index:
+        dataset.index = dataset.build_index()
+    rows = dataset.filter(size=args.size, logo=args.logo, audience=args.audience)
+    if args.shard:
+        shard, num_shards = (int(value) for value in args.shard.split("/"))
+        rows = dataset.shard(shard, num_shards, rows)
+    rows = rows[:args.limit] if args.limit is not None else rows
+    if args.count:
+        print(len(rows))
+    else:
+        for record in dataset.records(rows):
+            print(json.dumps(asdict(record), ensure_ascii=False))
@@ -0,0 +1,275 @@
+"""
+Bounded history of the design reviewer / refinement loop. Only the latest render is sent as an image; earlier rounds
+become compact records of their FEEDBACK items (addressed or still open), geometry findings and layout changes.
+Repeated feedback is merged, feedback raised for more than MAX_REPEATS rounds is dropped (the reviewer prompt's
+"stop suggesting it again" rule), and the rendered history is trimmed to a token budget, oldest rounds first.
+
+    history = ReviewHistory(token_budget=1500)
+    history.add_round(feedback, layout=layout, image="render_1.png", findings=validate_layout(layout))
+    content = history.message_content("render_2.png")  # history text and the render to review, for the reviewer
+"""
+import argparse
+import json
+import re
+
+from prompts.design_reviewer_prompt import history_prompt
+from tools.pillow_renderer import iter_elements
+from tools.tracing import count_tokens, estimate_image_tokens
+
+# Rounds a feedback item may be raised before it is dropped, from the reviewer prompt rules
+MAX_REPEATS = 2
+# Word-set overlap above which two feedback items count as the same
+SIMILARITY = 0.6
+DEFAULT_TOKEN_BUDGET = 1500
+# Layout changes listed per round once the history is over budget
+BRIEF_CHANGES = 3
+
+STOPWORDS = {"the", "and", "to", "of", "a", "an", "is", "in", "for", "with", "be", "it", "on", "or", "that", "this", "as", "by", "at"}
+BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+WORD_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+
+def feedback_items(feedback) -> list:
+    """
+    FEEDBACK items of a reviewer response: its bullet or numbered lines, or its sentences when there are none
+    """
+    if isinstance(feedback, (list, tuple)):
+        return [str(item).strip() for item in feedback if str(item).strip()]
+    lines = [line for line in str(feedback).splitlines() if line.strip()]
+    bullets = [BULLET_PATTERN.sub("", line).strip() for line in lines if BULLET_PATTERN.match(line)]
+    if bullets:
+        return bullets
+    text = " ".join(line.strip() for line in lines if not line.strip().endswith(":"))
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+
+
+def _words(text: str) -> frozenset:
+    # Numbers are masked so that "move it 12px left" and "move it 8px left" are the same request
+    return frozenset("#" if word[0].isdigit() else word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS)
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Jaccard overlap of the content words of two feedback items
+    """
+    words_a, words_b = _words(a), _words(b)
+    return len(words_a & words_b) / len(words_a | words_b) if words_a or words_b else 1.0
+
+
+def _short(value) -> str:
+    text = json.dumps(value, ensure_ascii=False) if not isinstance(value, str) else value
+    return text if len(text) <= 30 else text[:27] + "..."
+
+
+def layout_diff(old: dict, new: dict) -> list:
+    """
+    What changed between two layouts, one line per element: added and removed elements and changed properties
+    """
+    old_elements, new_elements = list(iter_elements(old or {})), list(iter_elements(new or {}))
+    changes = []
+    for i in range(max(len(old_elements), len(new_elements))):
+        if i >= len(old_elements):
+            changes.append(f"added {new_elements[i][0]} {i}")
+            continue
+        if i >= len(new_elements):
+            changes.append(f"removed {old_elements[i][0]} {i}")
+            continue
+        (kind, before), (_, after) = old_elements[i], new_elements[i]
+        text = str(before.get("text", "")).strip()
+        label = f"{kind} {i}" + (f' "{text[:20]}"' if text else "")
+        changed = [f"{key} {_short(before.get(key))} -> {_short(after.get(key))}"
+                   for key in dict.fromkeys(list(before) + list(after)) if before.get(key) != after.get(key)]
+        if changed:
+            changes.append(f"{label}: " + ", ".join(changed))
+    return changes
+
+
+def _image_size(image, layout: dict = None):
+    if isinstance(image, str) and not image.startswith("data:"):
+        from PIL import Image
+        with Image.open(image) as opened:
+            return opened.size
+    if layout and layout.get("background_width") and layout.get("background_height"):
+        from tools.pillow_renderer import parse_number
+        return parse_number(layout["background_width"]), parse_number(layout["background_height"])
+    return None
+
+
+class ReviewHistory:
+    """
+    Feedback items and layout changes of every review round, rendered as a history whose text stays under
+    token_budget no matter how many rounds there were. model only selects the image token estimate.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, max_repeats: int = MAX_REPEATS,
+                 similarity_threshold: float = SIMILARITY, model: str = "gpt-4o"):
+        self.token_budget = token_budget
+        self.max_repeats = max_repeats
+        self.similarity_threshold = similarity_threshold
+        self.model = model
+        self.items = []
+        self.rounds = []
+        self._layout = None
+
+    def _match(self, text: str):
+        best, score = None, self.similarity_threshold
+        for item in self.items:
+            value = similarity(text, item["text"])
+            if value >= score:
+                best, score = item, value
+        return best
+
+    def add_round(self, feedback, layout: dict = None, image=None, findings: dict = None) -> list:
+        """
+        Record a review round: the reviewer's feedback, the layout it reviewed, its render (path or data url) and the
+        layout_validator result. Feedback not raised again is marked addressed. Returns the feedback items worth
+        passing on to the refinement step: new or still open ones, without duplicates and dropped ones.
+        """
+        number = len(self.rounds) + 1
+        # This round's reviewer saw the history of the rounds before it and one render, instead of every earlier
+        # render and feedback block
+        history_tokens = count_tokens(self.render()) if self.rounds else 0
+        full_history_tokens = sum(record["feedback_tokens"] + record["image_tokens"] for record in self.rounds)
+        texts = feedback_items(feedback)
+        if findings:
+            texts += [finding["message"] for finding in findings.get("findings", [])]
+        raised, kept = [], []
+        for text in texts:
+            item = self._match(text)
+            if item is None:
+                item = {"id": len(self.items) + 1, "text": text, "first": number, "last": 0, "count": 0, "status": "open"}
+                self.items.append(item)
+            if item["last"] == number:
+                # Repeated within the same round
+                continue
+            # Keep the reviewer's latest wording, its numbers may have changed since the item was first raised
+            item["text"] = text
+            item["count"] += 1
+            item["last"] = number
+            item["status"] = "dropped" if item["count"] > self.max_repeats else "open"
+            raised.append(item["id"])
+            if item["status"] == "open":
+                kept.append(item["text"])
+        for item in self.items:
+            if item["status"] == "open" and item["last"] < number:
+                item["status"] = "addressed"
+                item["addressed"] = number
+
+        changes = layout_diff(self._layout, layout) if self._layout is not None and layout is not None else []
+        if layout is not None:
+            self._layout = layout
+        size = _image_size(image, layout) if image is not None else None
+        image_tokens = estimate_image_tokens(*size, self.model) if size else 0
+        self.rounds.append({
+            "round": number,
+            "items": raised,
+            "open": len(kept),
+            "dropped": len(raised) - len(kept),
+            "changes": changes,
+            "image_tokens": image_tokens,
+            "feedback_tokens": count_tokens("\n".join(texts)),
+            "prompt_tokens": history_tokens + image_tokens,
+            "full_prompt_tokens": full_history_tokens + image_tokens,
+        })
+        return kept
+
+    def open_items(self) -> list:
+        return [item["text"] for item in self.items if item["status"] == "open"]
+
+    def _item_line(self, item: dict) -> str:
+        if item["status"] == "addressed":
+            status = f"addressed in round {item['addressed']}"
+        else:
+            status = f"{item['status']}, raised {item['count']}x"
+        return f"- [{status}] {item['text']}"
+
+    def _round_lines(self, record: dict, brief: bool) -> list:
+        items = [self.items[i - 1] for i in record["items"]]
+        if brief:
+            # Over budget: only feedback that still matters and the first few changes
+            items = [item for item in items if item["status"] == "open" and item["last"] == record["round"]]
+        lines = [f"Round {record['round']}:"]
+        lines += [self._item_line(item) for item in items]
+        changes = record["changes"][:BRIEF_CHANGES] if brief else record["changes"]
+        if changes:
+            more = len(record["changes"]) - len(changes)
+            lines.append("  layout changes: " + "; ".join(changes) + (f"; and {more} more" if more else ""))
+        return lines
+
+    def render(self) -> str:
+        """
+        The history as prompt text, within token_budget: older rounds are shortened first, then left out
+        """
+        dropped = [item for item in self.items if item["status"] == "dropped"]
+        header = ["Do not suggest again:"] + [f"- {item['text']}" for item in dropped] if dropped else []
+        brief = [False] * len(self.rounds)
+        start = 0
+        while True:
+            lines = list(header)
+            if start:
+                lines.append(f"({start} earlier rounds omitted)")
+            for record, short in zip(self.rounds[start:], brief[start:]):
+                lines += self._round_lines(record, short)
+            text = "\n".join(lines)
+            if count_tokens(text) <= self.token_budget or start >= len(self.rounds) - 1:
+                return text
+            if not all(brief[start:]):
+                brief[brief.index(False, start)] = True
+            else:
+                start += 1
+
+    def message_content(self, image: str, image_options: dict = None) -> list:
+        """
+        Content parts for the next reviewer call: the compacted history and the render to review (path or data url)
+        as the only image
+        """
+        from tools.tool_utils import prepare_image_message
+
+        content = []
+        if self.rounds:
+            content.append({"type": "text", "text": history_prompt.format(history=self.render())})
+        url = image if image.startswith("data:") else prepare_image_message(image, **(image_options or {}))
+        return content + [{"type": "text", "text": "The current rendered image is:"}, {"type": "image_url", "image_url": {"url": url}}]
+
+    def prompt_report(self) -> list:
+        """
+        Per round: feedback items raised, passed on and dropped, layout changes, and the reviewer's history and image
+        tokens against sending every earlier render and feedback block
+        """
+        return [{
+            "round": record["round"],
+            "items": len(record["items"]),
+            "open": record["open"],
+            "dropped": record["dropped"],
+            "changes": len(record["changes"]),
+            "prompt_tokens": record["prompt_tokens"],
+            "full_prompt_tokens": record["full_prompt_tokens"],
+        } for record in self.rounds]
+
+
+if __name__ == "__main__":
+    from tools.tracing import format_table
+
+    parser = argparse.ArgumentParser(description="Replay review rounds through the history manager and report the prompt size per round")
+    parser.add_argument("rounds", type=str, help='JSONL of {"feedback", "layout" (dict or path), "image"} rounds')
+    parser.add_argument("--token_budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--max_repeats", type=int, default=MAX_REPEATS)
+    parser.add_argument("--model", type=str, default="gpt-4o", help="Model the image token estimate is for")
+    parser.add_argument("--show", action="store_true", help="Print the final history text")
+    args = parser.parse_args()
+
+    history = ReviewHistory(args.token_budget, args.max_repeats, model=args.model)
+    with open(args.rounds, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            layout = entry.get("layout")
+            if isinstance(layout, str):
+                with open(layout, "r") as layout_file:
+                    layout = json.load(layout_file)
+            history.add_round(entry.get("feedback", ""), layout, entry.get("image"))
+    print(format_table(history.prompt_report()))
+    if args.show:
+        print()
+        print(history.render())
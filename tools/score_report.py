@@ -0,0 +1,254 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from tools.request_dataset import AUDIENCE_PATTERN, SIZE_PATTERN
+
+GROUPINGS = [("metric",), ("metric", "evaluator"), ("metric", "size"), ("metric", "audience")]
+BOOTSTRAP_SAMPLES = 1000
+CONFIDENCE = 0.95
+
+
+def _request_fields(request: str):
+    """
+    Banner size and audience of a request text, parsed the way tools.request_dataset does
+    """
+    size = SIZE_PATTERN.search(request)
+    audience = AUDIENCE_PATTERN.search(request)
+    return f"{size.group(1)}x{size.group(2)}" if size else "unknown", audience.group(1).strip() if audience else "unknown"
+
+
+def _encode(values) -> tuple:
+    """
+    (labels, codes) of a pyarrow string column, nulls as "unknown"
+    """
+    import pyarrow.compute as pc
+
+    encoded = pc.fill_null(values, "unknown").combine_chunks().dictionary_encode()
+    return encoded.dictionary.to_numpy(zero_copy_only=False).astype(str), encoded.indices.to_numpy().astype(np.int64)
+
+
+def load_results(paths: list) -> dict:
+    """
+    Eval result JSONL files as columns: the score (NaN for failed rows), the judged item (image and request), and
+    (labels, codes) pairs for metric, evaluator, size and audience. Rows without an evaluator field take the file name
+    as their evaluator. Size and audience are parsed once per distinct banner request.
+    """
+    import pyarrow as pa
+    import pyarrow.json as pj
+
+    tables = []
+    for path in paths:
+        table = pj.read_json(path)
+        if "evaluator" not in table.column_names:
+            table = table.append_column("evaluator", pa.array([os.path.splitext(os.path.basename(path))[0]] * len(table)))
+        if "score" not in table.column_names:
+            table = table.append_column("score", pa.nulls(len(table), pa.float64()))
+        tables.append(table.select(["image_file", "banner_request", "metric", "evaluator", "score"]).cast(pa.schema([
+            ("image_file", pa.string()), ("banner_request", pa.string()), ("metric", pa.string()),
+            ("evaluator", pa.string()), ("score", pa.float64()),
+        ])))
+    table = pa.concat_tables(tables)
+
+    requests, request_codes = _encode(table["banner_request"])
+    images, image_codes = _encode(table["image_file"])
+    columns = {
+        "score": table["score"].to_numpy().astype(float),
+        # A judged banner: the same image and request scored by any evaluator
+        "item": image_codes * len(requests) + request_codes,
+        "metric": _encode(table["metric"]),
+        "evaluator": _encode(table["evaluator"]),
+    }
+    fields = np.array([_request_fields(request) for request in requests]).reshape(-1, 2)
+    for i, name in enumerate(("size", "audience")):
+        labels, request_labels = np.unique(fields[:, i], return_inverse=True)
+        columns[name] = (labels, request_labels.reshape(-1)[request_codes])
+    return columns
+
+
+def _group_codes(columns: dict, by: tuple):
+    """
+    Group code of every row and the label tuple of every group, for the combination of the `by` columns
+    """
+    combined = np.zeros(len(columns["score"]), dtype=np.int64)
+    for key in by:
+        labels, codes = columns[key]
+        combined = combined * len(labels) + codes
+    groups, codes = np.unique(combined, return_inverse=True)
+    keys = []
+    for key in reversed(by):
+        labels, _ = columns[key]
+        keys.append(labels[groups % len(labels)])
+        groups = groups // len(labels)
+    return keys[::-1], codes.reshape(-1)
+
+
+def _score_counts(codes: np.ndarray, scores: np.ndarray, n_groups: int):
+    levels, level_codes = np.unique(scores, return_inverse=True)
+    counts = np.zeros((n_groups, len(levels)))
+    np.add.at(counts, (codes, level_codes.reshape(-1)), 1)
+    return levels, counts
+
+
+def bootstrap_interval(codes: np.ndarray, scores: np.ndarray, n_groups: int, confidence: float = CONFIDENCE,
+                       samples: int = BOOTSTRAP_SAMPLES, seed: int = 0) -> tuple:
+    """
+    Bootstrap percentile interval of every group's mean score at once.
+    Resampling a group with replacement only changes how often each distinct score is drawn. For integer scores
+    the distribution of the resampled sum is the n-fold convolution of the group's score frequencies, computed
+    exactly with one FFT per group size, as if infinitely many bootstrap samples were drawn. Other scores fall back
+    to `samples` multinomial draws per group.
+    """
+    levels, counts = _score_counts(codes, scores, n_groups)
+    sizes = counts.sum(axis=1).astype(np.int64)
+    alpha = (1 - confidence) / 2
+    low, high = np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+    if not len(levels):
+        return low, high
+    if np.all(levels == np.round(levels)):
+        offset, span = int(levels.min()), int(levels.max() - levels.min())
+        frequencies = np.zeros((n_groups, span + 1))
+        frequencies[:, (levels - offset).astype(int)] = counts / np.maximum(sizes, 1)[:, None]
+        # Groups of the same size share one batched FFT
+        for n in np.unique(sizes[sizes > 0]):
+            rows = np.nonzero(sizes == n)[0]
+            length = int(n) * span + 1
+            spectrum = np.fft.rfft(frequencies[rows], length, axis=1)
+            cdf = np.cumsum(np.clip(np.fft.irfft(spectrum ** int(n), length, axis=1), 0, None), axis=1)
+            cdf /= cdf[:, -1:]
+            low[rows] = offset + (cdf < alpha).sum(axis=1) / n
+            high[rows] = offset + (cdf < 1 - alpha).sum(axis=1) / n
+        return low, high
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(sizes, counts / np.maximum(sizes, 1)[:, None], size=(samples, n_groups))
+    means = (draws @ levels) / np.maximum(sizes, 1)
+    low, high = np.quantile(means, [alpha, 1 - alpha], axis=0)
+    return np.where(sizes > 0, low, np.nan), np.where(sizes > 0, high, np.nan)
+
+
+def summarize(columns: dict, by: tuple = ("metric",), confidence: float = CONFIDENCE, samples: int = BOOTSTRAP_SAMPLES, seed: int = 0) -> dict:
+    """
+    Per-group count, failures, mean, standard deviation and bootstrap confidence interval of the score, as columns
+    """
+    keys, codes = _group_codes(columns, by)
+    n_groups = len(keys[0])
+    scores = columns["score"]
+    valid = ~np.isnan(scores)
+    n = np.bincount(codes[valid], minlength=n_groups)
+    total = np.bincount(codes[valid], weights=scores[valid], minlength=n_groups)
+    squares = np.bincount(codes[valid], weights=scores[valid] ** 2, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        std = np.sqrt(np.maximum(squares / n - mean ** 2, 0) * n / np.maximum(n - 1, 1))
+    low, high = bootstrap_interval(codes[valid], scores[valid], n_groups, confidence, samples, seed)
+    summary = dict(zip(by, keys))
+    summary.update({
+        "n": n,
+        "failed": np.bincount(codes[~valid], minlength=n_groups),
+        "mean": np.round(mean, 4),
+        "std": np.round(std, 4),
+        "ci_low": np.round(low, 4),
+        "ci_high": np.round(high, 4),
+    })
+    return summary
+
+
+def _quadratic_kappa(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Quadratic weighted Cohen's kappa of two integer rating arrays
+    """
+    levels = np.union1d(a, b)
+    if len(levels) < 2:
+        return 1.0
+    ia, ib = np.searchsorted(levels, a), np.searchsorted(levels, b)
+    observed = np.zeros((len(levels), len(levels)))
+    np.add.at(observed, (ia, ib), 1)
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / len(a)
+    i, j = np.indices(observed.shape)
+    weights = (levels[i] - levels[j]) ** 2
+    return float(1 - (weights * observed).sum() / (weights * expected).sum()) if (weights * expected).sum() else 1.0
+
+
+def agreement(columns: dict) -> dict:
+    """
+    Agreement of every evaluator pair on the banners and metrics both scored: exact and within-one agreement,
+    mean difference, Pearson correlation and quadratic weighted kappa, per metric and overall
+    """
+    evaluators, evaluator_codes = columns["evaluator"]
+    metrics, metric_codes = columns["metric"]
+    valid = ~np.isnan(columns["score"])
+    cells, cell_codes = np.unique(columns["item"] * len(metrics) + metric_codes, return_inverse=True)
+    cell_codes = cell_codes.reshape(-1)
+    cell_metric = cells % len(metrics)
+    # One row per (banner, metric) cell, one column per evaluator, NaN where an evaluator has no score
+    grid = np.full((len(cells), len(evaluators)), np.nan)
+    grid[cell_codes[valid], evaluator_codes[valid]] = columns["score"][valid]
+
+    rows = {key: [] for key in ("evaluator_a", "evaluator_b", "metric", "n", "exact", "within_one", "mean_diff", "pearson", "kappa")}
+    for i in range(len(evaluators)):
+        for j in range(i + 1, len(evaluators)):
+            both = ~np.isnan(grid[:, i]) & ~np.isnan(grid[:, j])
+            for metric in [None] + list(np.unique(cell_metric[both])):
+                mask = both & ((cell_metric == metric) if metric is not None else True)
+                a, b = grid[mask, i], grid[mask, j]
+                if not len(a):
+                    continue
+                diff = a - b
+                pearson = float(np.corrcoef(a, b)[0, 1]) if len(a) > 1 and a.std() and b.std() else float("nan")
+                values = (evaluators[i], evaluators[j], "all" if metric is None else metrics[metric], len(a), np.mean(diff == 0),
+                          np.mean(np.abs(diff) <= 1), diff.mean(), pearson, _quadratic_kappa(a, b))
+                for key, value in zip(rows, values):
+                    rows[key].append(round(float(value), 4) if isinstance(value, (float, np.floating)) else value)
+    return {key: np.array(values) for key, values in rows.items()}
+
+
+def to_markdown(table: dict) -> str:
+    columns = list(table)
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in zip(*(table[column] for column in columns)):
+        lines.append("| " + " | ".join("" if isinstance(v, float) and np.isnan(v) else str(v) for v in row) + " |")
+    return "\n".join(lines)
+
+
+def write_parquet(table: dict, path: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pq.write_table(pa.table({key: pa.array(values.tolist()) for key, values in table.items()}), path)
+
+
+def build_report(paths: list, groupings: list = GROUPINGS, confidence: float = CONFIDENCE, samples: int = BOOTSTRAP_SAMPLES, seed: int = 0) -> dict:
+    """
+    Summary tables keyed by name ("metric", "metric_evaluator", ..., "agreement")
+    """
+    columns = load_results(paths)
+    report = {"_".join(by): summarize(columns, by, confidence, samples, seed) for by in groupings}
+    if len(columns["evaluator"][0]) > 1:
+        report["agreement"] = agreement(columns)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate eval result JSONL files into score summaries with bootstrap confidence intervals")
+    parser.add_argument("results", type=str, nargs="+", help="Result JSONL files from eval.py --manifest, e.g. one per evaluator")
+    parser.add_argument("--by", type=str, nargs="+", action="append", help="Columns to group by (metric, evaluator, size, audience); repeat for several tables")
+    parser.add_argument("--output_dir", type=str, help="Write each table as <name>.parquet and all of them to report.md")
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP_SAMPLES, help="Bootstrap samples per group, for non-integer scores")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = build_report(args.results, [tuple(by) for by in args.by] if args.by else GROUPINGS, args.confidence, args.bootstrap, args.seed)
+    elapsed = time.perf_counter() - start
+    markdown = "\n\n".join(f"## {name}\n\n{to_markdown(table)}" for name, table in report.items())
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, table in report.items():
+            write_parquet(table, os.path.join(args.output_dir, f"{name}.parquet"))
+        with open(os.path.join(args.output_dir, "report.md"), "w") as f:
+            f.write(markdown + "\n")
+    print(markdown)
+    print(f"\nAggregated in {elapsed:.3f}s")
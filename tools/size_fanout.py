@@ -0,0 +1,292 @@
+"""
+Multi-size fan-out: derive the layouts of all standard banner sizes from one master layout, so the strategist,
+copy and foreground design run once per request instead of once per size.
+
+Each target size is laid out by constraint-based retargeting with the rules of prompts/foreground_designer_prompt.py:
+the typography tier of the size (keeping where the master's font sizes sat within their tier), logo sizing, edge
+margins, logo clear space and element gaps. Wide banners (leaderboards) get a single row, all others a vertical
+stack. Text is shrunk step by step, then body and subheadline are dropped until everything fits. Every derived layout
+goes through tools/layout_validator.py; only the sizes it flags need the multimodal review. Sizes render in parallel.
+
+    python -m tools.size_fanout layout.json --logo_image logo.png --background_image background.png --output_dir fanout
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from tools.demonstration_index import size_class
+from tools.layout_validator import LOGO_CLEAR_SPACE, MIN_EDGE_MARGIN, UTILIZATION_RANGE, validate_layout
+from tools.logo_rasterizer import banner_logo_size
+from tools.pillow_renderer import iter_elements, measure_element, parse_number, render_many
+from tools.request_dataset import BANNER_SIZES
+
+# Typography Hierarchy of the foreground designer prompt, (min, max) px per tier and role
+TYPOGRAPHY = {
+    "small": {"headline": (24, 32), "subheadline": (18, 24), "body": (14, 16), "cta": (16, 18)},
+    "medium": {"headline": (32, 48), "subheadline": (24, 32), "body": (16, 20), "cta": (18, 24)},
+    "large": {"headline": (48, 72), "subheadline": (32, 48), "body": (20, 28), "cta": (24, 32)},
+}
+# Responsive Spacing: element gap as a share of the smallest dimension, by banner width
+GAP_RATIOS = ((300, 0.08), (728, 0.10), (float("inf"), 0.15))
+# Width / height from which a banner is laid out as a single row
+WIDE_ASPECT = 3.0
+MIN_FONT_SIZE = 10
+FONT_SCALES = np.round(np.arange(1.0, 0.19, -0.05), 2)
+# Text that is left out, in this order, when a size cannot fit everything
+DROP_ORDER = ("body", "subheadline")
+# Validator warnings that still send a size to the multimodal review; utilization alone does not
+REVIEW_WARNINGS = {"edge_margin", "logo_clear_space", "logo_size"}
+
+ROLE_HINTS = (("sub", "subheadline"), ("tag", "subheadline"), ("head", "headline"), ("title", "headline"), ("body", "body"), ("desc", "body"))
+POSITION_KEYS = {"position", "size", "x", "y", "width", "height", "font_size", "fontSize"}
+
+
+def text_roles(layout: dict) -> list:
+    """
+    (role, spec) of every text element: headline, subheadline or body, from the element's role/name/type when it
+    says so, otherwise by font size (largest is the headline, the next the subheadline)
+    """
+    texts = [spec for kind, spec in iter_elements(layout) if kind == "text"]
+    roles = []
+    for spec in texts:
+        hint = " ".join(str(spec.get(key, "")) for key in ("role", "name", "id", "type")).lower()
+        roles.append(next((role for word, role in ROLE_HINTS if word in hint), None))
+    if any(role is None for role in roles):
+        ranked = sorted(range(len(texts)), key=lambda i: -parse_number(texts[i].get("font_size", texts[i].get("fontSize")), 16))
+        for rank, i in enumerate(ranked):
+            if roles[i] is None:
+                roles[i] = "headline" if rank == 0 else "subheadline" if rank == 1 else "body"
+    return list(zip(roles, texts))
+
+
+def _tier_position(role: str, font_size: float, tier: str) -> float:
+    low, high = TYPOGRAPHY[tier][role]
+    return float(np.clip((font_size - low) / (high - low), 0, 1))
+
+
+def _font_size(role: str, position: float, tier: str, scale: float, within_tier: bool = True) -> int:
+    low, high = TYPOGRAPHY[tier][role]
+    return max(low if within_tier else MIN_FONT_SIZE, int(round((low + position * (high - low)) * scale)))
+
+
+def _spec(spec: dict, **values) -> dict:
+    return {**{key: value for key, value in spec.items() if key not in POSITION_KEYS}, **values}
+
+
+def _column(width, height, margin, gap, texts, cta, logo, centered):
+    """
+    Logo, texts and CTA stacked top to bottom, spread over the height. None when they do not fit.
+    """
+    available = width - 2 * margin
+    items = []
+    if logo is not None:
+        spec, (logo_w, logo_h) = logo
+        items.append(("logo", spec, logo_w, logo_h, {}))
+    for role, spec, font_size in texts:
+        _, _, _, text_h = measure_element("text", _spec(spec, width=available, font_size=font_size))
+        items.append(("text", spec, available, text_h, {"font_size": font_size}))
+    if cta is not None:
+        spec, font_size = cta
+        _, _, button_w, button_h = measure_element("button", _spec(spec, font_size=font_size))
+        items.append(("button", spec, min(button_w, available), button_h, {"font_size": font_size}))
+    gaps = [max(gap, LOGO_CLEAR_SPACE) if items[i][0] == "logo" or items[i + 1][0] == "logo" else gap for i in range(len(items) - 1)]
+    content = sum(item[3] for item in items) + sum(gaps)
+    if content > height - 2 * margin and gaps:
+        # Gaps may shrink to half, but not below the logo clear space, before the text has to
+        squeeze = max(0.5, 1 - (content - height + 2 * margin) / sum(gaps))
+        gaps = [max(g * squeeze, LOGO_CLEAR_SPACE) if g >= LOGO_CLEAR_SPACE else g * squeeze for g in gaps]
+        content = sum(item[3] for item in items) + sum(gaps)
+    if content > height - 2 * margin or not items:
+        return None
+    # Spread the stack towards the middle of the utilization range
+    span = min(height - 2 * margin, max(content, np.mean(UTILIZATION_RANGE) * height))
+    extra = (span - content) / len(gaps) if gaps else 0
+    y = (height - span) / 2 if gaps else (height - content) / 2
+    placed = []
+    for i, (kind, spec, item_w, item_h, values) in enumerate(items):
+        x = (width - item_w) / 2 if centered and kind != "text" else margin
+        if kind == "text":
+            values = {**values, "alignment": "center" if centered else spec.get("alignment", "left")}
+        placed.append((kind, _spec(spec, x=round(x), y=round(y), width=round(item_w), height=round(item_h), **values)))
+        y += item_h + (gaps[i] + extra if i < len(gaps) else 0)
+    return placed
+
+
+def _row(width, height, margin, gap, texts, cta, logo):
+    """
+    Logo on the left, texts stacked in the middle and the CTA on the right. None when they do not fit.
+    """
+    available = height - 2 * margin
+    placed, left, right = [], margin, width - margin
+    if logo is not None:
+        spec, (logo_w, logo_h) = logo
+        if logo_h > available:
+            logo_w, logo_h = logo_w * available / logo_h, available
+        placed.append(("logo", _spec(spec, x=round(left), y=round((height - logo_h) / 2), width=round(logo_w), height=round(logo_h))))
+        left += logo_w + max(gap, LOGO_CLEAR_SPACE)
+    if cta is not None:
+        spec, font_size = cta
+        _, _, button_w, button_h = measure_element("button", _spec(spec, font_size=font_size))
+        if button_h > available:
+            return None
+        right -= button_w
+        placed.append(("button", _spec(spec, x=round(right), y=round((height - button_h) / 2), width=round(button_w), height=round(button_h), font_size=font_size)))
+        right -= gap
+    column = right - left
+    if column < 4 * MIN_FONT_SIZE:
+        return None
+    line_gap = max(2, gap / 3)
+    measured = []
+    for role, spec, font_size in texts:
+        _, _, _, text_h = measure_element("text", _spec(spec, width=column, font_size=font_size))
+        measured.append((spec, text_h, font_size))
+    content = sum(text_h for _, text_h, _ in measured) + line_gap * max(len(measured) - 1, 0)
+    if content > available:
+        return None
+    y = (height - content) / 2
+    for spec, text_h, font_size in measured:
+        placed.append(("text", _spec(spec, x=round(left), y=round(y), width=round(column), height=round(text_h), font_size=font_size)))
+        y += text_h + line_gap
+    return placed
+
+
+def retarget_layout(master: dict, width: int, height: int, logo_size: tuple = None) -> dict:
+    """
+    Layout of the master's copy, CTA and logo for a width x height banner. logo_size is the logo image's size,
+    used for its aspect ratio. The result has the master's other top-level fields, plus "dropped": the roles of
+    text elements left out to make the rest fit, and "below_tier": whether fonts had to go below the size's
+    typography tier.
+    """
+    master_tier = size_class(parse_number(master.get("background_width"), width), parse_number(master.get("background_height"), height))
+    tier = size_class(width, height)
+    texts = [(role, spec, _tier_position(role, parse_number(spec.get("font_size", spec.get("fontSize")), 16), master_tier))
+             for role, spec in text_roles(master)]
+    buttons = [spec for kind, spec in iter_elements(master) if kind == "button"]
+    logos = [spec for kind, spec in iter_elements(master) if kind == "logo"]
+
+    logo = None
+    if logos:
+        _, _, logo_w, logo_h = measure_element("logo", logos[0], logo_size)
+        aspect = logo_size[0] / logo_size[1] if logo_size else logo_w / logo_h if logo_w and logo_h else 1.0
+        logo = (logos[0], banner_logo_size(width, height, aspect))
+    cta_position = _tier_position("cta", parse_number(buttons[0].get("font_size", buttons[0].get("fontSize")), 16), master_tier) if buttons else 0.0
+    gap = next(ratio for limit, ratio in GAP_RATIOS if width < limit) * min(width, height)
+    margin = max(MIN_EDGE_MARGIN, min(24, round(0.06 * min(width, height))))
+    wide = width / height >= WIDE_ASPECT
+    centered = any(str(spec.get("alignment", spec.get("text_align", ""))).lower() == "center" for _, spec, _ in texts)
+
+    # Shrink text within the size's typography tier, dropping body and subheadline as needed, and only go below the
+    # tier when even the headline alone does not fit
+    remaining, dropped, placed = list(texts), [], None
+    for within_tier in (True, False):
+        while placed is None:
+            for scale in FONT_SCALES:
+                sized = [(role, spec, _font_size(role, position, tier, scale, within_tier)) for role, spec, position in remaining]
+                cta = (buttons[0], _font_size("cta", cta_position, tier, scale, within_tier)) if buttons else None
+                placed = _row(width, height, margin, gap, sized, cta, logo) if wide else _column(width, height, margin, gap, sized, cta, logo, centered)
+                if placed is not None:
+                    break
+            role = next((role for role in DROP_ORDER if any(r == role for r, _, _ in remaining)), None)
+            if placed is not None or role is None:
+                break
+            index = max(i for i, (r, _, _) in enumerate(remaining) if r == role)
+            dropped.append(role)
+            remaining = remaining[:index] + remaining[index + 1:]
+        if placed is not None:
+            break
+    if placed is None:
+        raise ValueError(f"The headline, CTA and logo do not fit a {width}x{height} banner even at the smallest font size")
+
+    layout = {key: value for key, value in master.items() if key not in ("elements", "text_elements", "cta_button", "logo")}
+    layout.update({"background_width": width, "background_height": height, "text_elements": [spec for kind, spec in placed if kind == "text"]})
+    for kind, spec in placed:
+        if kind != "text":
+            layout["cta_button" if kind == "button" else "logo"] = spec
+    layout["dropped"] = dropped
+    layout["below_tier"] = not within_tier
+    return layout
+
+
+def fanout(master: dict, sizes: list = BANNER_SIZES, logo_size: tuple = None, background_image=None, logo_image=None,
+           output_dir: str = None, max_workers: int = None) -> list:
+    """
+    Retarget the master layout to every size and validate it. Returns one entry per size with its layout, the
+    validator result and "needs_review", set for the sizes the multimodal reviewer should still look at: those that
+    fail validation or have a review warning, dropped copy or fonts below their typography tier.
+    With output_dir, all sizes are rendered in a process pool; background_image is a path, or {(width, height): path}
+    for backgrounds generated per size.
+    """
+    if logo_size is None and logo_image is not None:
+        from PIL import Image
+        with Image.open(logo_image) as logo:
+            logo_size = logo.size
+    results = []
+    for width, height in sizes:
+        start = time.perf_counter()
+        layout = retarget_layout(master, width, height, logo_size)
+        validation = validate_layout(layout, logo_size=logo_size)
+        results.append({
+            "size": f"{width}x{height}",
+            "tier": size_class(width, height),
+            "layout": layout,
+            "validation": validation,
+            "needs_review": not validation["ok"] or any(finding["rule"] in REVIEW_WARNINGS for finding in validation["findings"])
+            or bool(layout["dropped"]) or layout["below_tier"],
+            "retarget_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        jobs = []
+        for result, (width, height) in zip(results, sizes):
+            background = background_image.get((width, height)) if isinstance(background_image, dict) else background_image
+            jobs.append({"layout": result["layout"], "background_image": background, "logo_image": logo_image,
+                         "output_path": os.path.join(output_dir, f"{result['size']}.png")})
+        for result, path in zip(results, render_many(jobs, max_workers)):
+            result["path"] = path
+    return results
+
+
+if __name__ == "__main__":
+    from tools.layout_validator import format_findings
+    from tools.tracing import format_table
+
+    parser = argparse.ArgumentParser(description="Derive the layouts of all standard banner sizes from one master layout")
+    parser.add_argument("layout", type=str, help="Master layout JSON from the foreground designer")
+    parser.add_argument("--sizes", type=str, help="Comma separated WxH sizes, defaults to the 13 standard sizes")
+    parser.add_argument("--logo_image", type=str)
+    parser.add_argument("--background_image", type=str)
+    parser.add_argument("--output_dir", type=str, help="Write <WxH>.json layouts and, with --render, <WxH>.png")
+    parser.add_argument("--render", action="store_true", help="Render every size in parallel")
+    parser.add_argument("--max_workers", type=int)
+    args = parser.parse_args()
+
+    with open(args.layout, "r") as f:
+        master = json.load(f)
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes.split(",")] if args.sizes else BANNER_SIZES
+    start = time.perf_counter()
+    results = fanout(master, sizes, background_image=args.background_image, logo_image=args.logo_image,
+                     output_dir=args.output_dir if args.render else None, max_workers=args.max_workers)
+    elapsed = time.perf_counter() - start
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for result in results:
+            with open(os.path.join(args.output_dir, f"{result['size']}.json"), "w") as f:
+                json.dump(result["layout"], f, indent=2)
+    print(format_table([{
+        "size": result["size"],
+        "tier": result["tier"],
+        "fonts": "/".join(str(spec.get("font_size")) for spec in result["layout"]["text_elements"]),
+        "dropped": ",".join(result["layout"]["dropped"]) or "-",
+        "below_tier": result["layout"]["below_tier"],
+        "utilization": result["validation"]["utilization"],
+        "needs_review": result["needs_review"],
+        "retarget_ms": result["retarget_ms"],
+    } for result in results]))
+    for result in results:
+        if result["needs_review"]:
+            notes = ([f"dropped {', '.join(result['layout']['dropped'])}"] if result["layout"]["dropped"] else []) + (["fonts below the typography tier"] if result["layout"]["below_tier"] else [])
+            print(f"\n{result['size']}:" + "".join(f"\n{note}" for note in notes) + f"\n{format_findings(result['validation'])}")
+    print(f"\n{len(results)} sizes in {elapsed:.2f}s, {sum(r['needs_review'] for r in results)} need review")
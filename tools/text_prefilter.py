@@ -0,0 +1,169 @@
+import argparse
+import json
+
+import numpy as np
+from PIL import Image
+
+# Verdicts of detect_text. Only "ambiguous" backgrounds need the LLM text_checker.
+CLEAN, AMBIGUOUS, TEXT = "clean", "ambiguous", "text"
+
+ANALYSIS_EDGE = 1024
+CONTRAST_THRESHOLD = 30
+# Clean only with no aligned character-like components and almost no high-contrast edges at all. On the synthetic
+# benchmark (python -m benchmarks.text_prefilter, seeds 0-3) this passes no background with text as clean (clean
+# precision 1.0, clean recall ~0.9) and still saves ~2/3 of text_checker calls. The earlier score <= 2 saved ~0.73 but
+# let ~5% of the clean verdicts through with text.
+CLEAN_MAX_SCORE = 0
+CLEAN_MAX_EDGE_DENSITY = 0.001
+TEXT_MIN_SCORE = 10
+
+
+def _load_gray(image, max_edge=ANALYSIS_EDGE):
+    image = Image.open(image) if isinstance(image, str) else image
+    if image.mode in ("RGBA", "LA", "P"):
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        image = flat
+    image = image.convert("L")
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _box_mean(gray, radius):
+    """
+    Mean over a (2r+1)^2 window via an integral image, edges clamped
+    """
+    padded = np.pad(gray, radius + 1, mode="edge")
+    integral = padded.cumsum(0).cumsum(1)
+    k = 2 * radius + 1
+    h, w = gray.shape
+    total = integral[k:k + h, k:k + w] - integral[:h, k:k + w] - integral[k:k + h, :w] + integral[:h, :w]
+    return total / (k * k)
+
+
+def _component_boxes(mask):
+    """
+    (x0, y0, x1, y1, area) of every 8-connected component of a boolean mask.
+    Components are built from horizontal runs, so the work scales with the number of runs rather than pixels.
+    """
+    edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    if not len(rows):
+        return np.zeros((0, 5))
+
+    parent = list(range(len(rows)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    row_start = np.searchsorted(rows, np.arange(mask.shape[0] + 1))
+    for row in range(mask.shape[0] - 1):
+        a, a_end = row_start[row], row_start[row + 1]
+        b, b_end = a_end, row_start[row + 2]
+        # Two pointers over the runs of this row and the next, touching diagonally counts as connected
+        while a < a_end and b < b_end:
+            if starts[a] <= ends[b] and starts[b] <= ends[a]:
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+            if ends[a] < ends[b]:
+                a += 1
+            else:
+                b += 1
+
+    roots = np.array([find(i) for i in range(len(rows))])
+    _, inverse = np.unique(roots, return_inverse=True)
+    n = inverse.max() + 1
+    x0 = np.full(n, np.inf); np.minimum.at(x0, inverse, starts)
+    y0 = np.full(n, np.inf); np.minimum.at(y0, inverse, rows)
+    x1 = np.zeros(n); np.maximum.at(x1, inverse, ends)
+    y1 = np.zeros(n); np.maximum.at(y1, inverse, rows + 1)
+    area = np.bincount(inverse, weights=ends - starts)
+    return np.stack([x0, y0, x1, y1, area], axis=1)
+
+
+def _aligned_characters(boxes, image_height):
+    """
+    Number of character-like components that sit in a row with at least two similar neighbours
+    """
+    if not len(boxes):
+        return 0
+    x0, y0, x1, y1, area = boxes.T
+    w, h = x1 - x0, y1 - y0
+    fill = area / (w * h)
+    char_like = (h >= max(4, 0.012 * image_height)) & (h <= 0.25 * image_height) \
+        & (w / h >= 0.08) & (w / h <= 2.5) & (fill >= 0.12) & (fill <= 0.9) & (area >= 12)
+    x0, y0, x1, y1, h = x0[char_like], y0[char_like], x1[char_like], y1[char_like], h[char_like]
+    if len(h) < 3:
+        return 0
+    center_y = (y0 + y1) / 2
+    similar_height = np.abs(np.log(h[:, None] / h[None, :])) < np.log(1.6)
+    same_row = np.abs(center_y[:, None] - center_y[None, :]) < 0.35 * np.minimum(h[:, None], h[None, :])
+    gap = np.maximum(x0[:, None] - x1[None, :], x0[None, :] - x1[:, None])
+    close = gap < 1.2 * np.maximum(h[:, None], h[None, :])
+    neighbours = similar_height & same_row & close
+    np.fill_diagonal(neighbours, False)
+    return int((neighbours.sum(axis=1) >= 2).sum())
+
+
+def text_features(image, contrast_threshold=CONTRAST_THRESHOLD) -> dict:
+    """
+    Stroke and component statistics of an image: edge density and the number of aligned character-like components
+    for dark-on-light and light-on-dark strokes
+    """
+    gray = _load_gray(image)
+    gradient = np.hypot(np.diff(gray, axis=1, prepend=gray[:, :1]), np.diff(gray, axis=0, prepend=gray[:1, :]))
+    edge_density = float((gradient > contrast_threshold).mean())
+    local_mean = _box_mean(gray, max(4, round(min(gray.shape) / 20)))
+    aligned = 0
+    for strokes in (gray < local_mean - contrast_threshold, gray > local_mean + contrast_threshold):
+        # Near-solid masks are textures or lighting, not strokes
+        if strokes.mean() > 0.35:
+            continue
+        aligned = max(aligned, _aligned_characters(_component_boxes(strokes), gray.shape[0]))
+    return {"edge_density": round(edge_density, 4), "aligned_characters": aligned}
+
+
+def detect_text(image, clean_max_score=CLEAN_MAX_SCORE, text_min_score=TEXT_MIN_SCORE, contrast_threshold=CONTRAST_THRESHOLD,
+                clean_max_edge_density=CLEAN_MAX_EDGE_DENSITY) -> dict:
+    """
+    Cheap local check for text in a generated background.
+    Returns the features and a verdict: "clean" (skip the LLM text_checker), "text" (regenerate) or "ambiguous" (ask the text_checker).
+    """
+    features = text_features(image, contrast_threshold)
+    score = features["aligned_characters"]
+    if score <= clean_max_score and features["edge_density"] <= clean_max_edge_density:
+        verdict = CLEAN
+    else:
+        verdict = TEXT if score >= text_min_score else AMBIGUOUS
+    return {"verdict": verdict, "score": score, **features}
+
+
+def check_text(image, llm_checker, **thresholds) -> bool:
+    """
+    Whether a background contains text, asking llm_checker(image) (the text_checker tool) only for ambiguous images
+    """
+    verdict = detect_text(image, **thresholds)["verdict"]
+    if verdict == AMBIGUOUS:
+        return llm_checker(image)
+    return verdict == TEXT
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check images for text before sending them to the LLM text_checker")
+    parser.add_argument("images", type=str, nargs="+")
+    parser.add_argument("--clean_max_score", type=int, default=CLEAN_MAX_SCORE)
+    parser.add_argument("--text_min_score", type=int, default=TEXT_MIN_SCORE)
+    parser.add_argument("--contrast_threshold", type=float, default=CONTRAST_THRESHOLD)
+    parser.add_argument("--clean_max_edge_density", type=float, default=CLEAN_MAX_EDGE_DENSITY)
+    args = parser.parse_args()
+
+    for path in args.images:
+        result = detect_text(path, args.clean_max_score, args.text_min_score, args.contrast_threshold, args.clean_max_edge_density)
+        print(json.dumps({"image": path, **result}))
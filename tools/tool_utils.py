@@ -1,6 +1,23 @@
 from mimetypes import guess_type
+from collections import OrderedDict
+from functools import lru_cache
 import base64
-from pydantic import BaseModel, Field
+import hashlib
+import io
+import os
+import threading
+from pydantic import BaseModel, Field, create_model
+
+IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+IMAGE_MEMORY_CACHE_SIZE = 256
+# Longest edge each provider actually looks at, larger images are downscaled server side anyway
+PROVIDER_MAX_EDGE = {"gpt4o": 2048, "claude": 1568}
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+_encoded_images = OrderedDict()
+_encoded_images_lock = threading.Lock()
+_encoding_locks = {}
+_image_stats = {"calls": 0, "memory_hits": 0, "disk_hits": 0, "encoded": 0, "original_bytes": 0, "payload_bytes": 0}
 
 class BOutput(BaseModel):
     """Banner ad score output"""
@@ -9,20 +26,154 @@ class BOutput(BaseModel):
 
     class Config:
         extra = "forbid"  # Prevents additional fields
+
+class MultiBOutput(BaseModel):
+    """Banner ad score output with one score and explanation per metric"""
+
+    class Config:
+        extra = "forbid"  # Prevents additional fields
+
+    def scores(self) -> dict:
+        return {metric: getattr(self, metric).model_dump() for metric in type(self).model_fields}
+
+def multi_output_model(metrics: list) -> type:
+    """
+    Build a MultiBOutput schema with a required BOutput field for each metric
+    """
+    return create_model(
+        "MultiBOutput",
+        __base__=MultiBOutput,
+        __doc__=MultiBOutput.__doc__,
+        **{metric: (BOutput, ...) for metric in metrics},
+    )
         
-def prepare_image_message(image_path: str) -> dict:
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_digest(path: str) -> str:
     """
-    Get the url of a local image
+    sha256 of a file's bytes, memoized per (path, mtime, size)
     """
-    try:
-        mime_type, _ = guess_type(image_path)
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def _preprocess_image(data: bytes, max_edge: int = None, image_format: str = None, quality: int = 85):
+    """
+    Downscale an encoded image so its longest edge is at most max_edge and re-encode it.
+    Returns the new bytes and mime type.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image_format = image_format or ("png" if image.format == "PNG" else "jpeg" if image.format == "JPEG" else "webp")
+    pil_format, mime_type = IMAGE_FORMATS[image_format]
+    if max_edge is not None and max(image.size) > max_edge:
+        scale = max_edge / max(image.size)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    if pil_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no alpha channel, flatten transparent logos onto white
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode == "P":
+        image = image.convert("RGBA")
+
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue(), mime_type
 
-        if mime_type is None:
-            mime_type = "application/octet-stream"
+def prepare_image_message(image_path: str, max_edge: int = None, image_format: str = None, quality: int = 85, disk_cache: bool = True) -> str:
+    """
+    Get the url of a local image.
+    With max_edge or image_format set, the image is downscaled and re-encoded (png, webp or jpeg at the given quality) first.
+    Data urls are memoized in memory by content hash and settings, and preprocessed ones also on disk under IMAGE_CACHE_DIR.
+    """
+    try:
+        preprocess = max_edge is not None or image_format is not None
+        if image_format is not None and image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format {image_format}, choose from {', '.join(IMAGE_FORMATS)}")
+        original_bytes = os.path.getsize(image_path)
+        key = f"{file_digest(image_path)}-{max_edge}-{image_format}-{quality if preprocess else None}"
 
-        with open(image_path, "rb") as image_file:
-            base64_encoded_data = base64.b64encode(image_file.read()).decode("utf-8")
+        with _encoded_images_lock:
+            _image_stats["calls"] += 1
+            _image_stats["original_bytes"] += original_bytes
+            url = _encoded_images.get(key)
+            if url is not None:
+                _encoded_images.move_to_end(key)
+                _image_stats["memory_hits"] += 1
+        if url is None:
+            with _encoded_images_lock:
+                key_lock = _encoding_locks.setdefault(key, threading.Lock())
+            # Concurrent callers asking for the same image wait for one encoder instead of all encoding it
+            with key_lock:
+                with _encoded_images_lock:
+                    url = _encoded_images.get(key)
+                    if url is not None:
+                        _image_stats["memory_hits"] += 1
+                if url is None:
+                    disk_path = os.path.join(IMAGE_CACHE_DIR, key + ".txt")
+                    if preprocess and disk_cache and os.path.isfile(disk_path):
+                        with open(disk_path, "r") as f:
+                            url = f.read()
+                        with _encoded_images_lock:
+                            _image_stats["disk_hits"] += 1
+                    else:
+                        with open(image_path, "rb") as image_file:
+                            data = image_file.read()
+                        if preprocess:
+                            data, mime_type = _preprocess_image(data, max_edge, image_format, quality)
+                        else:
+                            mime_type, _ = guess_type(image_path)
+                            if mime_type is None:
+                                mime_type = "application/octet-stream"
+                        base64_encoded_data = base64.b64encode(data).decode("utf-8")
+                        url = f"data:{mime_type};base64,{base64_encoded_data}"
+                        with _encoded_images_lock:
+                            _image_stats["encoded"] += 1
+                        if preprocess and disk_cache:
+                            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+                            tmp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}"
+                            with open(tmp_path, "w") as f:
+                                f.write(url)
+                            os.replace(tmp_path, disk_path)
+                    with _encoded_images_lock:
+                        _encoded_images[key] = url
+                        while len(_encoded_images) > IMAGE_MEMORY_CACHE_SIZE:
+                            _encoded_images.popitem(last=False)
+            with _encoded_images_lock:
+                _encoding_locks.pop(key, None)
 
-        return f"data:{mime_type};base64,{base64_encoded_data}"
+        with _encoded_images_lock:
+            # base64 carries 3 payload bytes per 4 characters, less the "=" padding of the last group
+            _image_stats["payload_bytes"] += (len(url) - url.index(",") - 1) * 3 // 4 - url.endswith("=") - url.endswith("==")
+        return url
     except Exception as e:
-        raise ValueError(f"Failed to process image at {image_path}: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Failed to process image at {image_path}: {str(e)}")
+
+def image_cache_stats() -> dict:
+    """
+    Counters of prepare_image_message calls, cache hits and bytes saved by preprocessing
+    """
+    with _encoded_images_lock:
+        stats = dict(_image_stats)
+    stats["saved_bytes"] = stats["original_bytes"] - stats["payload_bytes"]
+    stats["saved_ratio"] = round(stats["saved_bytes"] / stats["original_bytes"], 3) if stats["original_bytes"] else 0.0
+    return stats
+
+def clear_image_cache():
+    """
+    Forget the in-memory data urls and reset the counters, e.g. between benchmark runs. The disk cache is kept.
+    """
+    with _encoded_images_lock:
+        _encoded_images.clear()
+        for key in _image_stats:
+            _image_stats[key] = 0
@@ -0,0 +1,338 @@
+"""
+Tracing of LLM and tool calls. Each call is recorded as one span with its stage (strategist, background_designer,
+foreground_designer, developer, reviewer, eval), metric, model, wall time, retries, token usage, payload bytes and
+estimated cost. Spans go to a JSONL or Parquet file. Retries count LangChain retries (on_retry) and, with the rate
+limiter, its retries before the span's attempt; retries inside the provider SDKs (their max_retries) are not visible.
+
+    from tools.tracing import Tracer, set_tracer, span, ainvoke
+    set_tracer(Tracer("traces.jsonl"))
+    with span("background_designer", kind="tool", name="text_checker"):
+        ...
+    response = await ainvoke(chat_model.with_structured_output(Schema), messages, "strategist", model=name)
+
+Summarize a trace with: python -m tools.tracing traces.jsonl
+"""
+import argparse
+import base64
+import io
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+STAGES = ("strategist", "background_designer", "foreground_designer", "developer", "reviewer", "eval")
+
+# USD per million (input, output) tokens, matched against the model name
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+}
+
+FIELDS = ["ts", "stage", "kind", "name", "metric", "model", "wall_time_s", "retries", "input_tokens", "output_tokens",
+          "image_tokens", "payload_bytes", "cost_usd", "error"]
+
+
+class Tracer:
+    """Collects spans into a JSONL file, or a Parquet file written on close when the path ends in .parquet"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._records = []
+        self._file = None if self.parquet else open(path, "a")
+
+    def record(self, record: dict):
+        with self._lock:
+            if self.parquet:
+                self._records.append(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self.parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                extra = sorted({key for record in self._records for key in record} - set(FIELDS))
+                columns = {key: [record.get(key) for record in self._records] for key in FIELDS}
+                # Free-form attributes are stored as JSON text so their types never clash across spans
+                columns.update({key: [None if record.get(key) is None else json.dumps(record[key], default=str) for record in self._records] for key in extra})
+                pq.write_table(pa.table(columns), self.path)
+            elif self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """
+    Route spans to tracer, or switch tracing off with None. Returns the previous tracer.
+    """
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def get_tracer():
+    return _tracer
+
+
+def price(model: str, input_tokens: int, output_tokens: int):
+    """
+    Estimated USD cost of a call, None for models without a known price
+    """
+    model = (model or "").lower()
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if name in model:
+            input_price, output_price = MODEL_PRICES[name]
+            return round(((input_tokens or 0) * input_price + (output_tokens or 0) * output_price) / 1e6, 6)
+    return None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken is missing or cannot download its vocabulary
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens of a text with the GPT-4o tokenizer, or about four characters per token without tiktoken
+    """
+    encoding = _encoding()
+    if encoding is None:
+        # Roughly four characters per token for English and JSON
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
+def estimate_image_tokens(width: int, height: int, model: str) -> int:
+    """
+    Provider token count of an image: 512px tiles for GPT-4o (high detail), pixels / 750 for Claude
+    """
+    if "claude" in (model or "").lower():
+        scale = min(1.0, 1568 / max(width, height))
+        return math.ceil(width * scale * height * scale / 750)
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+
+def _image_size(url: str):
+    from PIL import Image
+
+    try:
+        # The dimensions are in the first bytes of png, jpeg and webp files
+        head = url[url.index(",") + 1:][:8192]
+        with Image.open(io.BytesIO(base64.b64decode(head[:len(head) // 4 * 4]))) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def payload_stats(messages, model: str = None) -> dict:
+    """
+    Bytes of text and images in a message list, and the estimated tokens of its images
+    """
+    payload_bytes, image_tokens = 0, 0
+    for message in messages:
+        content = getattr(message, "content", message.get("content") if isinstance(message, dict) else message)
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+                payload_bytes += len(url)
+                size = _image_size(url) if url.startswith("data:") else None
+                image_tokens += estimate_image_tokens(*size, model) if size else 0
+            else:
+                payload_bytes += len(str(part.get("text", "") if isinstance(part, dict) else part).encode("utf-8"))
+    return {"payload_bytes": payload_bytes, "image_tokens": image_tokens}
+
+
+@contextmanager
+def span(stage: str, kind: str = "tool", name: str = None, metric: str = None, model: str = None, **attrs):
+    """
+    Time the enclosed call and record it with the current tracer. Yields the span dict, so the caller
+    can add token counts, retries or other attributes. Errors are recorded and re-raised.
+    """
+    if _tracer is None:
+        yield {}
+        return
+    record = {"ts": time.time(), "stage": stage, "kind": kind, "name": name, "metric": metric, "model": model, "retries": 0, **attrs}
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["wall_time_s"] = round(time.perf_counter() - start, 6)
+        if record.get("cost_usd") is None and (record.get("input_tokens") or record.get("output_tokens")):
+            record["cost_usd"] = price(record.get("response_model") or model, record.get("input_tokens"), record.get("output_tokens"))
+        _tracer.record(record)
+
+
+def _usage_callback(record: dict):
+    """
+    LangChain callback handler that adds the token usage and retries of an LLM call to its span
+    """
+    from langchain_core.callbacks import AsyncCallbackHandler
+
+    class UsageCallback(AsyncCallbackHandler):
+        async def on_llm_end(self, response, **kwargs):
+            usage = {}
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage = getattr(message, "usage_metadata", None) or usage
+                    model = (getattr(message, "response_metadata", None) or {}).get("model_name") or (getattr(message, "response_metadata", None) or {}).get("model")
+                    if model:
+                        record["response_model"] = model
+            if not usage and response.llm_output:
+                token_usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+                usage = {"input_tokens": token_usage.get("prompt_tokens", token_usage.get("input_tokens")),
+                         "output_tokens": token_usage.get("completion_tokens", token_usage.get("output_tokens"))}
+            record["input_tokens"] = (record.get("input_tokens") or 0) + (usage.get("input_tokens") or 0)
+            record["output_tokens"] = (record.get("output_tokens") or 0) + (usage.get("output_tokens") or 0)
+
+        async def on_retry(self, retry_state, **kwargs):
+            record["retries"] += 1
+
+    return UsageCallback()
+
+
+async def ainvoke(runnable, messages, stage: str, metric: str = None, model: str = None, name: str = None, **attrs):
+    """
+    runnable.ainvoke(messages) recorded as an LLM span with its payload size and token usage, and scheduled through
+    the rate limiter set with tools.rate_limiter.set_scheduler
+    """
+    from tools.rate_limiter import get_scheduler
+
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return await _ainvoke(runnable, messages, None, stage, metric, model, name, **attrs)
+    response, attempts = {}, itertools.count()
+    # Each attempt is its own span, with the scheduler's retries before it
+    return await scheduler.run(lambda: _ainvoke(runnable, messages, response, stage, metric, model, name, **{**attrs, "retries": next(attempts)}),
+                               messages, model, stage, headers=lambda _: response.get("headers"))
+
+
+def _headers_callback(response: dict):
+    """
+    LangChain callback handler that keeps the HTTP response headers of an LLM call, for clients that report them
+    (ChatOpenAI/AzureChatOpenAI with include_response_headers)
+    """
+    from langchain_core.callbacks import AsyncCallbackHandler
+
+    class HeadersCallback(AsyncCallbackHandler):
+        async def on_llm_end(self, result, **kwargs):
+            for generations in result.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+                    headers = metadata.get("headers") or (generation.generation_info or {}).get("headers")
+                    if headers:
+                        response["headers"] = headers
+
+    return HeadersCallback()
+
+
+async def _ainvoke(runnable, messages, response: dict, stage: str, metric: str = None, model: str = None, name: str = None, **attrs):
+    try:
+        from langchain_core.runnables import Runnable
+    except ImportError:
+        Runnable = None
+    callbacks = [_headers_callback(response)] if response is not None and Runnable is not None and isinstance(runnable, Runnable) else []
+    if _tracer is None:
+        return await runnable.ainvoke(messages, config={"callbacks": callbacks}) if callbacks else await runnable.ainvoke(messages)
+    with span(stage, kind="llm", name=name, metric=metric, model=model, **attrs) as record:
+        record.update(payload_stats(messages, model))
+        if Runnable is not None and isinstance(runnable, Runnable):
+            return await runnable.ainvoke(messages, config={"callbacks": callbacks + [_usage_callback(record)]})
+        return await runnable.ainvoke(messages)
+
+
+def load_spans(path: str) -> list:
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: list, by=("stage",)) -> list:
+    """
+    Calls, errors, p50/p95/p99 latency, tokens and cost for each group of spans
+    """
+    import numpy as np
+
+    groups = {}
+    for record in spans:
+        groups.setdefault(tuple(record.get(key) for key in by), []).append(record)
+    rows = []
+    for key, records in sorted(groups.items(), key=lambda item: -sum(r.get("wall_time_s") or 0 for r in item[1])):
+        latency = np.array([r.get("wall_time_s") or 0.0 for r in records])
+        costs = [r["cost_usd"] for r in records if r.get("cost_usd") is not None]
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        rows.append({
+            **dict(zip(by, key)),
+            "calls": len(records),
+            "errors": sum(bool(r.get("error")) for r in records),
+            "retries": sum(r.get("retries") or 0 for r in records),
+            "p50_s": round(float(p50), 3),
+            "p95_s": round(float(p95), 3),
+            "p99_s": round(float(p99), 3),
+            "total_s": round(float(latency.sum()), 3),
+            "input_tokens": sum(r.get("input_tokens") or 0 for r in records),
+            "image_tokens": sum(r.get("image_tokens") or 0 for r in records),
+            "output_tokens": sum(r.get("output_tokens") or 0 for r in records),
+            "payload_mb": round(sum(r.get("payload_bytes") or 0 for r in records) / 1e6, 3),
+            "cost_usd": round(sum(costs), 4) if costs else None,
+        })
+    return rows
+
+
+def format_table(rows: list) -> str:
+    if not rows:
+        return "No spans."
+    columns = list(rows[0])
+    cells = [[("-" if row[column] is None else str(row[column])) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(cell[i]) for cell in cells)) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize latency, tokens and cost of a trace per stage and per metric")
+    parser.add_argument("trace", type=str, nargs="+", help="JSONL or Parquet trace files")
+    parser.add_argument("--by", type=str, nargs="+", help="Fields to group by, default: stage, then stage and metric")
+    parser.add_argument("--kind", type=str, choices=["llm", "tool"], help="Only summarize LLM or tool spans")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    spans = [record for path in args.trace for record in load_spans(path)]
+    if args.kind:
+        spans = [record for record in spans if record.get("kind") == args.kind]
+    groupings = [tuple(args.by)] if args.by else [("stage",), ("stage", "metric")]
+    summaries = {" / ".join(by): summarize(spans, by) for by in groupings}
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print("\n\n".join(f"By {title}:\n{format_table(rows)}" for title, rows in summaries.items()))